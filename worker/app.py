@@ -6,18 +6,21 @@ Handles local LLM inference, embeddings, and RAG pipelines
 import os
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 from typing import Optional
 
 import uvicorn
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from fastapi.responses import ORJSONResponse
+from prometheus_client import (
+    CollectorRegistry, Counter, Histogram, generate_latest, multiprocess, CONTENT_TYPE_LATEST
+)
 from starlette.responses import Response
 
 from routers import chat, embedding, rag
-from models.config import Settings
+from models.config import get_settings
 from rag.reranker import Reranker
 from rag.pipeline import RAGPipeline
 
@@ -25,11 +28,21 @@ from rag.pipeline import RAGPipeline
 REQUEST_COUNT = Counter('worker_requests_total', 'Total requests', ['endpoint', 'status'])
 REQUEST_LATENCY = Histogram('worker_request_latency_seconds', 'Request latency', ['endpoint'])
 
+# Labelled metric children, memoized per (endpoint, status) / endpoint
+_count_children = {}
+_latency_children = {}
+
 # Settings
-settings = Settings()
+settings = get_settings()
 
 # Global instances
-reranker_model = Reranker()
+reranker_model = Reranker(
+    batch_size=settings.reranker_batch_size,
+    url=settings.rerank_url,
+    timeout=settings.remote_timeout,
+    backend=settings.reranker_backend,
+    onnx_dir=settings.embedding_onnx_dir
+)
 rag_pipeline: Optional[RAGPipeline] = None
 
 @asynccontextmanager
@@ -39,26 +52,72 @@ async def lifespan(app: FastAPI):
     print("🚀 Starting AI Worker...")
     
     # Initialize models on startup
-    from models import embedding_model, llm_model
+    from models import embedding_model, cached_embedder, llm_model, SemanticCache, RetrievalBatcher
     
     print("📦 Loading embedding model...")
     embedding_model.initialize()
+    cached_embedder.warmup(settings.embedding_cache_warmup)
     
     print("🤖 Initializing LLM...")
     llm_model.initialize()
+    if settings.llm_semantic_cache:
+        llm_model.response_cache = SemanticCache(
+            cached_embedder,
+            threshold=settings.llm_semantic_cache_threshold,
+            ttl=settings.llm_semantic_cache_ttl,
+            max_entries=settings.llm_semantic_cache_size
+        )
 
     print("🧐 Initializing Reranker...")
     reranker_model.initialize()
 
     print("🛠️ Initializing RAG Pipeline...")
+    query_cache = None
+    if settings.rag_semantic_cache:
+        query_cache = SemanticCache(
+            cached_embedder,
+            threshold=settings.rag_semantic_cache_threshold,
+            ttl=settings.rag_semantic_cache_ttl,
+            max_entries=settings.rag_semantic_cache_size
+        )
+    search_cache = None
+    if settings.rag_search_cache:
+        search_cache = SemanticCache(
+            cached_embedder,
+            threshold=settings.rag_search_cache_threshold,
+            ttl=settings.rag_search_cache_ttl,
+            max_entries=settings.rag_search_cache_size
+        )
     rag_pipeline = RAGPipeline(
-        embedding_model=embedding_model,
+        embedding_model=cached_embedder,
         llm_model=llm_model,
         reranker_model=reranker_model,
-        dimension=embedding_model.dimension
+        dimension=embedding_model.dimension,
+        batch_size=settings.embedding_batch_size,
+        index_type=settings.vector_index_type,
+        storage=settings.vector_storage,
+        nprobe=settings.vector_nprobe,
+        hnsw_m=settings.vector_hnsw_m,
+        ef_construction=settings.vector_hnsw_ef_construction,
+        ef_search=settings.vector_hnsw_ef_search,
+        response_cache=query_cache,
+        context_window=settings.llm_context_window,
+        search_cache=search_cache,
+        hybrid_alpha=settings.rag_hybrid_alpha
     )
     # Make pipeline available to the router
     rag.router.pipeline = rag_pipeline
+    rag.router.executor = ThreadPoolExecutor(
+        max_workers=settings.rag_executor_workers,
+        thread_name_prefix="rag"
+    )
+    rag.router.retrieval_batcher = RetrievalBatcher(
+        rag_pipeline,
+        max_batch_size=settings.rag_batch_max_size,
+        max_queue_time=settings.rag_batch_max_wait_ms / 1000,
+        max_concurrent_batches=settings.rag_batch_max_concurrency
+    )
+    rag.warm_up_models()
 
     print("✅ AI Worker ready!")
     
@@ -66,13 +125,18 @@ async def lifespan(app: FastAPI):
     
     # Cleanup
     print("👋 Shutting down AI Worker...")
+    await rag.router.retrieval_batcher.stop()
+    from models import async_embedder
+    await async_embedder.stop()
+    rag.router.executor.shutdown(wait=False, cancel_futures=True)
 
 # Create app
 app = FastAPI(
     title="AI Worker",
     description="Python AI Worker for local LLM inference, embeddings, and RAG",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS
@@ -93,16 +157,25 @@ app.include_router(rag.router, prefix="/v1", tags=["RAG"])
 @app.middleware("http")
 async def metrics_middleware(request: Request, call_next):
     """Track request metrics"""
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     response = await call_next(request)
     
-    latency = time.time() - start_time
-    endpoint = request.url.path
+    latency = time.perf_counter() - start_time
+    # Label by route template (e.g. /items/{id}) so path parameters can't explode cardinality
+    route = request.scope.get("route")
+    endpoint = route.path if route is not None else "unmatched"
     status = "success" if response.status_code < 400 else "error"
     
-    REQUEST_COUNT.labels(endpoint=endpoint, status=status).inc()
-    REQUEST_LATENCY.labels(endpoint=endpoint).observe(latency)
+    counter = _count_children.get((endpoint, status))
+    if counter is None:
+        counter = _count_children[(endpoint, status)] = REQUEST_COUNT.labels(endpoint=endpoint, status=status)
+    histogram = _latency_children.get(endpoint)
+    if histogram is None:
+        histogram = _latency_children[endpoint] = REQUEST_LATENCY.labels(endpoint=endpoint)
+    
+    counter.inc()
+    histogram.observe(latency)
     
     return response
 
@@ -146,8 +219,16 @@ async def detailed_health():
 @app.get("/metrics")
 async def metrics():
     """Prometheus metrics endpoint"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # Aggregate the samples written by every worker process
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        content = generate_latest(registry)
+    else:
+        content = generate_latest()
+    
     return Response(
-        content=generate_latest(),
+        content=content,
         media_type=CONTENT_TYPE_LATEST
     )
 
@@ -155,7 +236,7 @@ async def metrics():
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     """Global exception handler"""
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "error": {
@@ -168,10 +249,19 @@ async def global_exception_handler(request: Request, exc: Exception):
 
 
 if __name__ == "__main__":
+    if settings.workers > 1:
+        # Must be set before worker processes import prometheus_client
+        os.makedirs(
+            os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", settings.prometheus_multiproc_dir),
+            exist_ok=True
+        )
+    
     uvicorn.run(
         "app:app",
         host=settings.host,
         port=settings.port,
         reload=settings.debug,
-        workers=1  # Single worker for model loading
+        workers=settings.workers,  # Each worker process loads its own models
+        loop="uvloop",
+        http="httptools"
     )
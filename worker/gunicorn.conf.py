@@ -0,0 +1,37 @@
+"""
+Gunicorn configuration for the AI Worker
+
+Run with:
+    gunicorn app:app -c gunicorn.conf.py
+
+Each worker process loads its own models and keeps its own in-memory RAG
+index, so documents indexed through one worker are not visible to the
+others. Keep WORKER_WORKERS=1 unless the RAG endpoints are not used.
+"""
+
+import os
+import shutil
+
+from models.config import get_settings
+
+settings = get_settings()
+
+if settings.workers > 1:
+    # Prometheus metrics are written per process and merged at /metrics.
+    # Start from an empty directory so stale samples from a previous run are dropped.
+    multiproc_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", settings.prometheus_multiproc_dir)
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+bind = f"{settings.host}:{settings.port}"
+workers = settings.workers
+# UvicornWorker picks uvloop and httptools when they are installed (uvicorn[standard])
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = 120
+
+
+def child_exit(server, worker):
+    """Drop the exited worker's live metrics from the multiprocess directory"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -2,11 +2,31 @@
 Models module - handles LLM and embedding model initialization
 """
 
+from models.config import get_settings
 from models.embedding_model import EmbeddingModel
 from models.llm_model import LLMModel
+from models.batcher import AsyncBatcher, AsyncEmbedder, RetrievalBatcher
+from models.embedding_cache import CachedEmbedder, LRUEmbeddingCache
+from models.semantic_cache import SemanticCache
+
+settings = get_settings()
 
 # Global instances
 embedding_model = EmbeddingModel()
 llm_model = LLMModel()
+cached_embedder = CachedEmbedder(
+    embedding_model,
+    capacity=settings.embedding_cache_size,
+    ttl=settings.embedding_cache_ttl
+)
+async_embedder = AsyncEmbedder(
+    cached_embedder,
+    max_batch_size=settings.embedding_batch_size,
+    max_queue_time=settings.embedding_batch_max_wait_ms / 1000
+)
 
-__all__ = ['embedding_model', 'llm_model', 'EmbeddingModel', 'LLMModel']
+__all__ = [
+    'embedding_model', 'llm_model', 'cached_embedder', 'async_embedder',
+    'EmbeddingModel', 'LLMModel', 'AsyncBatcher', 'AsyncEmbedder', 'RetrievalBatcher',
+    'CachedEmbedder', 'LRUEmbeddingCache', 'SemanticCache'
+]
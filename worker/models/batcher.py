@@ -0,0 +1,166 @@
+"""
+Async request batching for model inference
+"""
+
+import abc
+import asyncio
+from typing import Any, List, Optional
+
+import numpy as np
+
+
+class AsyncBatcher(abc.ABC):
+    """
+    Coalesces concurrent single-item requests into batches.
+    
+    Items submitted through `process` within `max_queue_time` seconds of each
+    other (up to `max_batch_size`) are handed to `process_batch` in one call.
+    Up to `max_concurrent_batches` batches run at once; while all of them are
+    busy, new items keep queueing and form the next, larger batch.
+    """
+    
+    def __init__(self, max_batch_size: int = 64, max_queue_time: float = 0.005, max_concurrent_batches: int = 4):
+        self.max_batch_size = max_batch_size
+        self.max_queue_time = max_queue_time
+        self.max_concurrent_batches = max_concurrent_batches
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Running batches, referenced so they are not garbage collected
+        self._batches = set()
+    
+    async def process(self, item: Any) -> Any:
+        """Submit a single item and wait for its result"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+    
+    @abc.abstractmethod
+    async def process_batch(self, items: List[Any]) -> List[Any]:
+        """Process a batch of items, returning one result per item"""
+    
+    async def stop(self):
+        """Cancel the background batching task"""
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        for task in list(self._batches):
+            task.cancel()
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.max_concurrent_batches)
+        while True:
+            # Wait for a free slot first, so items arriving meanwhile join this batch
+            await slots.acquire()
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_queue_time
+            
+            # Collect more items until the batch is full or the window closes
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            task = asyncio.create_task(self._run_batch(batch, slots))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+            
+    async def _run_batch(self, batch: List[tuple], slots: asyncio.Semaphore):
+        try:
+            results = await self.process_batch([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            slots.release()
+        
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class AsyncEmbedder(AsyncBatcher):
+    """Batches concurrent embedding requests into a single encode call"""
+    
+    def __init__(self, embedding_model, max_batch_size: int = 64, max_queue_time: float = 0.005):
+        super().__init__(max_batch_size=max_batch_size, max_queue_time=max_queue_time)
+        self.embedding_model = embedding_model
+    
+    async def process_batch(self, texts: List[str]) -> List[np.ndarray]:
+        embeddings = await asyncio.to_thread(
+            self.embedding_model.encode,
+            texts,
+            batch_size=self.max_batch_size
+        )
+        return list(embeddings)
+    
+    async def encode(self, texts: List[str]) -> np.ndarray:
+        """Embed texts, sharing forward passes with concurrent callers"""
+        if not texts:
+            return np.empty((0, self.embedding_model.dimension), dtype=np.float32)
+        embeddings = await asyncio.gather(*[self.process(text) for text in texts])
+        return np.stack(embeddings)
+
+
+class RetrievalBatcher(AsyncBatcher):
+    """
+    Runs RAG retrievals with the embedding and vector search of concurrent
+    requests coalesced into one RAGPipeline.search_candidates call.
+    
+    Query expansion (an LLM call) and reranking stay per request and run on
+    worker threads concurrently, so a slow request never holds up the rest of
+    its batch.
+    """
+    
+    def __init__(self, pipeline, max_batch_size: int = 16, max_queue_time: float = 0.01, max_concurrent_batches: int = 4):
+        super().__init__(
+            max_batch_size=max_batch_size,
+            max_queue_time=max_queue_time,
+            max_concurrent_batches=max_concurrent_batches
+        )
+        self.pipeline = pipeline
+    
+    async def process_batch(self, items: List[tuple]) -> List[List[dict]]:
+        queries, expansions, metadata_filters, candidates, alphas = zip(*items)
+        return await asyncio.to_thread(
+            self.pipeline.search_candidates,
+            list(queries),
+            list(expansions),
+            list(metadata_filters),
+            list(candidates),
+            list(alphas)
+        )
+    
+    async def retrieve(
+        self,
+        query: str,
+        top_k: int = 5,
+        metadata_filter: Optional[dict] = None,
+        candidates: Optional[int] = None,
+        alpha: Optional[float] = None
+    ) -> List[dict]:
+        """Retrieve for one query, sharing embedding and search with concurrent callers"""
+        pipeline = self.pipeline
+        count, alpha = pipeline.retrieval_params(top_k, candidates, alpha)
+        if pipeline.search_cache is not None:
+            cached = await asyncio.to_thread(
+                pipeline.lookup_retrieval, query, top_k, metadata_filter, None, count, alpha
+            )
+            if cached is not None:
+                return cached
+
+        expansions = await asyncio.to_thread(pipeline.query_expander.expand, query)
+        docs = await self.process((query, expansions, metadata_filter, count, alpha))
+        return await asyncio.to_thread(
+            pipeline.finish_retrieval, query, docs, top_k, metadata_filter, None, count, alpha
+        )
@@ -2,8 +2,9 @@
 Configuration settings for AI Worker
 """
 
+from functools import lru_cache
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -13,30 +14,80 @@ class Settings(BaseSettings):
     host: str = "0.0.0.0"
     port: int = 8000
     debug: bool = False
+    workers: int = 1
+    prometheus_multiproc_dir: str = "/tmp/prometheus_multiproc"
     
     # Embedding model
     embedding_model: str = "all-MiniLM-L6-v2"
     embedding_dimension: int = 384
+    embedding_backend: str = "onnx"  # "onnx", "sentence-transformers"
+    embed_url: Optional[str] = None  # OpenAI-compatible embedding server (Infinity, TEI); overrides the backend
+    embedding_onnx_dir: str = "./data/onnx"
+    embedding_max_length: int = 256
+    embedding_batch_size: int = 64
+    embedding_batch_max_wait_ms: float = 5
+    embedding_cache_size: int = 10_000
+    embedding_cache_ttl: int = 3600
+    embedding_cache_warmup: List[str] = []
     
     # LLM settings
     llm_mode: str = "mock"  # "mock", "vllm", "llamacpp"
     llm_model_path: Optional[str] = None
     llm_max_tokens: int = 2048
     llm_temperature: float = 0.7
+    llm_n_threads: int = 4  # llama.cpp CPU threads
+    llm_context_window: int = 4096
+    llm_semantic_cache: bool = False
+    llm_semantic_cache_threshold: float = 0.95
+    llm_semantic_cache_ttl: int = 3600
+    llm_semantic_cache_size: int = 1000
     
     # vLLM settings (if using vLLM)
     vllm_model: str = "Qwen/Qwen2.5-0.5B-Instruct"
     vllm_tensor_parallel_size: int = 1
     vllm_gpu_memory_utilization: float = 0.9
     
+    # Reranker
+    reranker_backend: str = "onnx"  # "onnx" (INT8, CPU only), "sentence-transformers"
+    reranker_batch_size: int = 32
+    rerank_url: Optional[str] = None  # Infinity/Cohere-style /rerank server; replaces the local cross-encoder
+    remote_timeout: float = 30.0
+    
     # RAG settings
     rag_chunk_size: int = 512
     rag_chunk_overlap: int = 50
     rag_top_k: int = 5
+    rag_executor_workers: int = 8
+    rag_batch_max_wait_ms: float = 10
+    rag_batch_max_size: int = 16
+    rag_batch_max_concurrency: int = 4
+    rag_index_batch_size: int = 64
+    rag_index_max_in_flight: int = 8
+    rag_hybrid_alpha: float = 1.0
+    rag_semantic_cache: bool = False
+    rag_semantic_cache_threshold: float = 0.87
+    rag_semantic_cache_ttl: int = 3600
+    rag_semantic_cache_size: int = 1000
+    rag_search_cache: bool = False
+    rag_search_cache_threshold: float = 0.97
+    rag_search_cache_ttl: int = 3600
+    rag_search_cache_size: int = 10_000
     
     # Vector store
     vector_store_path: str = "./data/vector_store"
+    vector_index_type: str = "auto"  # "auto", "flat", "faiss", "hnsw", "ivfpq"
+    vector_storage: str = "float32"  # "float32", "int8"
+    vector_nprobe: int = 16
+    vector_hnsw_m: int = 32
+    vector_hnsw_ef_construction: int = 200
+    vector_hnsw_ef_search: int = 64
     
     class Config:
         env_file = ".env"
         env_prefix = "WORKER_"
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Return the process-wide settings, parsed from the environment once"""
+    return Settings()
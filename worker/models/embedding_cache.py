@@ -0,0 +1,126 @@
+"""
+LRU cache in front of the embedding model
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+
+class LRUEmbeddingCache:
+    """Thread-safe LRU cache of embeddings with a time-to-live"""
+    
+    def __init__(self, capacity: int = 10_000, ttl: float = 3600):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._data: "OrderedDict[Tuple[str, bytes], Tuple[float, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Tuple[str, bytes]) -> Optional[np.ndarray]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            stored_at, embedding = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return embedding
+    
+    def put(self, key: Tuple[str, bytes], embedding: np.ndarray):
+        with self._lock:
+            self._data[key] = (time.monotonic(), embedding)
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+    
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class CachedEmbedder:
+    """
+    Wraps an embedding model so repeated texts skip the forward pass.
+    
+    Entries are keyed by (model name, content hash), so swapping models never
+    serves stale vectors. Only normalized embeddings are cached; other
+    attributes are delegated to the wrapped model so the wrapper can be used
+    wherever the model is.
+    """
+    
+    def __init__(self, embedding_model, capacity: int = 10_000, ttl: float = 3600):
+        self.embedding_model = embedding_model
+        self.cache = LRUEmbeddingCache(capacity=capacity, ttl=ttl)
+        self._warm: Dict[Tuple[str, bytes], np.ndarray] = {}
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+    
+    def __getattr__(self, name):
+        return getattr(self.embedding_model, name)
+    
+    def _key(self, text: str) -> Tuple[str, bytes]:
+        return self.embedding_model.model_name, hashlib.blake2b(text.encode(), digest_size=16).digest()
+    
+    def encode(self, texts: Union[str, List[str]], normalize: bool = True, **kwargs) -> np.ndarray:
+        """Encode texts, computing only the ones missing from the cache"""
+        if isinstance(texts, str):
+            texts = [texts]
+        if not normalize or not texts:
+            return self.embedding_model.encode(texts, normalize=normalize, **kwargs)
+        
+        keys = [self._key(text) for text in texts]
+        results: List[Optional[np.ndarray]] = []
+        for key in keys:
+            embedding = self._warm.get(key)
+            if embedding is None:
+                embedding = self.cache.get(key)
+            results.append(embedding)
+        
+        missing = [i for i, embedding in enumerate(results) if embedding is None]
+        with self._stats_lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            # Encode each distinct missing text once
+            pending: Dict[Tuple[str, bytes], str] = {}
+            for i in missing:
+                pending.setdefault(keys[i], texts[i])
+            embeddings = self.embedding_model.encode(list(pending.values()), **kwargs)
+            # Own each row; a cached view would keep the whole batch array alive
+            computed = {key: embedding.copy() for key, embedding in zip(pending.keys(), embeddings)}
+            for key, embedding in computed.items():
+                self.cache.put(key, embedding)
+            for i in missing:
+                results[i] = computed[keys[i]]
+        
+        return np.stack(results)
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for the stats endpoint"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.cache),
+            "capacity": self.cache.capacity,
+            "warm_entries": len(self._warm),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+    
+    def warmup(self, texts: List[str]):
+        """Precompute embeddings for common queries; these are never evicted"""
+        if not texts:
+            return
+        embeddings = self.embedding_model.encode(list(texts))
+        for text, embedding in zip(texts, embeddings):
+            self._warm[self._key(text)] = embedding.copy()
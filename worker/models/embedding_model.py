@@ -1,12 +1,28 @@
 """
-Embedding model using Sentence Transformers
+Embedding model using ONNX Runtime (INT8) with a Sentence Transformers fallback,
+or a remote OpenAI-compatible embedding server
 """
 
+import os
+import threading
 import numpy as np
-from typing import List, Union, Optional
-from models.config import Settings
+from typing import Dict, List, Union, Optional, Tuple
+from models.config import get_settings
+from models.onnx_export import export_int8_onnx
 
-settings = Settings()
+settings = get_settings()
+
+# Static shapes the ONNX session is run at; batches are padded up to the nearest bucket
+SEQ_BUCKETS = (32, 64, 128, 256)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def _bucket(value: int, buckets: Tuple[int, ...]) -> int:
+    """Smallest bucket that fits `value`, or `value` itself if it exceeds them all"""
+    for size in buckets:
+        if value <= size:
+            return size
+    return value
 
 
 class EmbeddingModel:
@@ -14,12 +30,36 @@ class EmbeddingModel:
     
     def __init__(self):
         self.model = None
+        self.session = None
+        self.tokenizer = None
+        self.client = None
         self.model_name = settings.embedding_model
         self.dimension = settings.embedding_dimension
         self._loaded = False
+        # (batch, seq_len) -> idle (input_ids, attention_mask, output, io_binding) sets;
+        # each concurrent run takes its own set, so inference itself runs unlocked
+        self._buffers: Dict[Tuple[int, int], List[tuple]] = {}
+        self._buffers_lock = threading.Lock()
     
     def initialize(self):
         """Load the embedding model"""
+        if settings.embed_url:
+            try:
+                self._init_remote()
+                return
+            except Exception as e:
+                print(f"Warning: Could not reach embedding server at {settings.embed_url}: {e}")
+                print("Falling back to the local model")
+                self.client = None
+        
+        if settings.embedding_backend == "onnx":
+            try:
+                self._init_onnx()
+                return
+            except Exception as e:
+                print(f"Warning: Could not load ONNX embedding model: {e}")
+                print("Falling back to sentence-transformers")
+        
         try:
             from sentence_transformers import SentenceTransformer
             
@@ -34,16 +74,84 @@ class EmbeddingModel:
             print("Using mock embeddings instead")
             self._loaded = True  # Use mock mode
     
+    def _init_remote(self):
+        """Connect to an embedding server that batches requests across callers"""
+        import httpx
+        
+        print(f"Using remote embedding server: {settings.embed_url}")
+        self.client = httpx.Client(
+            base_url=settings.embed_url,
+            timeout=settings.remote_timeout,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=64)
+        )
+        # One probe request checks the server and reports the real dimension
+        self.dimension = self._encode_remote(["dimension probe"], normalize=False).shape[1]
+        self._loaded = True
+        print(f"Remote embedding model ready. Dimension: {self.dimension}")
+    
+    def _init_onnx(self):
+        """Export the model to ONNX once, quantize to INT8 and open an ORT session"""
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        
+        self.tokenizer = AutoTokenizer.from_pretrained(self._hub_id())
+        
+        onnx_path = os.path.join(
+            settings.embedding_onnx_dir,
+            f"{self.model_name.replace('/', '_')}-int8.onnx"
+        )
+        if not os.path.exists(onnx_path):
+            self._export_onnx(onnx_path)
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        
+        print(f"Loading ONNX embedding model: {onnx_path}")
+        self.session = ort.InferenceSession(
+            onnx_path,
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.dimension = self.session.get_outputs()[0].shape[-1]
+        self._loaded = True
+        print(f"ONNX embedding model loaded. Dimension: {self.dimension}")
+    
+    def _export_onnx(self, onnx_path: str):
+        """Export the HuggingFace model to ONNX (opset 14) and quantize weights to UINT8"""
+        from transformers import AutoModel
+        
+        print(f"Exporting {self.model_name} to ONNX...")
+        export_int8_onnx(
+            AutoModel.from_pretrained(self._hub_id()),
+            self.tokenizer(["export"], return_tensors="pt"),
+            input_names=["input_ids", "attention_mask"],
+            output_name="last_hidden_state",
+            output_axes={0: "batch", 1: "sequence"},
+            onnx_path=onnx_path
+        )
+    
+    def _hub_id(self) -> str:
+        """Resolve short sentence-transformers names to their HuggingFace Hub id"""
+        if "/" in self.model_name:
+            return self.model_name
+        return f"sentence-transformers/{self.model_name}"
+    
     def is_loaded(self) -> bool:
         return self._loaded
     
-    def encode(self, texts: Union[str, List[str]], normalize: bool = True) -> np.ndarray:
+    def encode(
+        self,
+        texts: Union[str, List[str]],
+        normalize: bool = True,
+        batch_size: int = 32
+    ) -> np.ndarray:
         """
         Generate embeddings for texts
         
         Args:
             texts: Single text or list of texts
             normalize: Whether to L2 normalize the embeddings
+            batch_size: Number of texts per forward pass
             
         Returns:
             numpy array of embeddings
@@ -51,9 +159,22 @@ class EmbeddingModel:
         if isinstance(texts, str):
             texts = [texts]
         
-        if self.model is not None:
+        if self.client is not None:
+            embeddings = np.concatenate([
+                self._encode_remote(texts[i:i + batch_size], normalize)
+                for i in range(0, len(texts), batch_size)
+            ]) if texts else np.empty((0, self.dimension), dtype=np.float32)
+        elif self.session is not None:
+            # Never run above the largest batch bucket, so buffers stay bounded
+            step = min(batch_size, BATCH_BUCKETS[-1])
+            embeddings = np.concatenate([
+                self._encode_onnx(texts[i:i + step], normalize)
+                for i in range(0, len(texts), step)
+            ]) if texts else np.empty((0, self.dimension), dtype=np.float32)
+        elif self.model is not None:
             embeddings = self.model.encode(
                 texts,
+                batch_size=batch_size,
                 normalize_embeddings=normalize,
                 show_progress_bar=False
             )
@@ -61,18 +182,86 @@ class EmbeddingModel:
             # Mock embeddings for demo without GPU
             embeddings = self._mock_embeddings(texts)
         
-        return np.array(embeddings)
+        # One C-contiguous float32 (n, dimension) matrix for every backend, so
+        # the vector store and FAISS take it without another conversion
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+    
+    def _encode_remote(self, texts: List[str], normalize: bool) -> np.ndarray:
+        """POST to the server's OpenAI-compatible /embeddings endpoint"""
+        response = self.client.post("/embeddings", json={"model": self.model_name, "input": texts})
+        response.raise_for_status()
+        data = sorted(response.json()["data"], key=lambda item: item["index"])
+        embeddings = np.array([item["embedding"] for item in data], dtype=np.float32)
+        if normalize:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings
+    
+    def _encode_onnx(self, texts: List[str], normalize: bool) -> np.ndarray:
+        """Run the ONNX session and mean-pool token embeddings in NumPy"""
+        # Pad only to the longest text in the batch, capped at the model's useful length
+        tokens = self.tokenizer(
+            texts,
+            padding="longest",
+            truncation=True,
+            max_length=settings.embedding_max_length,
+            return_tensors="np"
+        )
+        input_ids = tokens["input_ids"]
+        attention_mask = tokens["attention_mask"]
+        batch, seq_len = input_ids.shape
+        mask = attention_mask.astype(np.float32)
+        
+        key = (_bucket(batch, BATCH_BUCKETS), _bucket(seq_len, SEQ_BUCKETS))
+        entry = self._acquire_buffers(key)
+        try:
+            ids_buf, mask_buf, out_buf, binding = entry
+            ids_buf.fill(self.tokenizer.pad_token_id or 0)
+            ids_buf[:batch, :seq_len] = input_ids
+            mask_buf.fill(0)
+            mask_buf[:batch, :seq_len] = attention_mask
+            self.session.run_with_iobinding(binding)
+            
+            # Mean pooling over non-padding tokens of the real rows only
+            embeddings = np.einsum("bsd,bs->bd", out_buf[:batch, :seq_len], mask)
+        finally:
+            with self._buffers_lock:
+                self._buffers[key].append(entry)
+        embeddings /= np.clip(mask.sum(axis=1, keepdims=True), 1e-9, None)
+        
+        if normalize:
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings
+    
+    def _acquire_buffers(self, key: Tuple[int, int]) -> tuple:
+        """An idle buffer set for this (batch, seq_len) bucket, allocated if all are in use"""
+        with self._buffers_lock:
+            idle = self._buffers.setdefault(key, [])
+            if idle:
+                return idle.pop()
+        
+        input_ids = np.zeros(key, dtype=np.int64)
+        attention_mask = np.zeros(key, dtype=np.int64)
+        output = np.empty((*key, self.dimension), dtype=np.float32)
+        
+        # Bind once: ORT reads and writes these arrays in place on every run
+        binding = self.session.io_binding()
+        binding.bind_cpu_input("input_ids", input_ids)
+        binding.bind_cpu_input("attention_mask", attention_mask)
+        binding.bind_output(
+            "last_hidden_state", "cpu", 0, np.float32,
+            list(output.shape), output.ctypes.data
+        )
+        return input_ids, attention_mask, output, binding
     
-    def _mock_embeddings(self, texts: List[str]) -> List[List[float]]:
+    def _mock_embeddings(self, texts: List[str]) -> np.ndarray:
         """Generate deterministic mock embeddings based on text content"""
-        embeddings = []
-        for text in texts:
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for i, text in enumerate(texts):
             # Create a deterministic embedding based on text hash
-            np.random.seed(hash(text) % (2**32))
-            embedding = np.random.randn(self.dimension).astype(np.float32)
-            # Normalize
-            embedding = embedding / np.linalg.norm(embedding)
-            embeddings.append(embedding.tolist())
+            rng = np.random.Generator(np.random.PCG64(hash(text) % (2**32)))
+            rng.standard_normal(self.dimension, dtype=np.float32, out=embeddings[i])
+        # Normalize all rows in one pass
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
         return embeddings
     
     def similarity(self, embedding1: np.ndarray, embedding2: np.ndarray) -> float:
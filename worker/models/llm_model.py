@@ -5,12 +5,25 @@ LLM Model with support for multiple backends:
 - LlamaCpp (for CPU inference)
 """
 
+import asyncio
+import functools
+import hashlib
+import re
+import threading
 import time
 import uuid
-from typing import List, Dict, Any, Optional, Generator
-from models.config import Settings
+from typing import List, Dict, Any, Optional, AsyncIterator, Generator, Tuple
+from models.config import get_settings
 
-settings = Settings()
+settings = get_settings()
+
+# Canned replies for mock mode, keyed by trigger keyword (earlier keys win)
+MOCK_RESPONSES = {
+    "hello": "Hello! I'm a local AI assistant running on your machine. How can I help you today?",
+    "how are you": "I'm doing great! I'm a local LLM running in mock mode for demo purposes. I can help answer questions and have conversations.",
+    "what can you do": "I'm a local AI assistant. In production mode, I can run actual LLM inference using vLLM or llama.cpp. Currently running in mock mode for demo.",
+    "test": "Test successful! The AI Worker is running correctly. In production, this would use an actual LLM model.",
+}
 
 
 class LLMModel:
@@ -21,6 +34,13 @@ class LLMModel:
         self.model = None
         self._loaded = False
         self.model_name = "local-llm"
+        self.response_cache = None  # Optional SemanticCache, attached at startup
+        self._mock_matcher = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None  # Loop driving the vLLM engine
+        # llama.cpp holds one context, so generations must not overlap
+        self._llamacpp_lock = threading.Lock()
+        self._llamacpp_limiter = None
+        self._tokenizer = None  # HF tokenizer for counting prompt tokens under vLLM
     
     def initialize(self):
         """Initialize the LLM based on configured mode"""
@@ -39,21 +59,40 @@ class LLMModel:
     def _init_mock(self):
         """Initialize mock mode (no actual model)"""
         print("Using mock LLM for demo")
+        self.mode = "mock"
+        try:
+            import ahocorasick
+            
+            # One automaton scans the message once regardless of keyword count
+            automaton = ahocorasick.Automaton()
+            for priority, (keyword, response) in enumerate(MOCK_RESPONSES.items()):
+                automaton.add_word(keyword, (priority, response))
+            automaton.make_automaton()
+            self._mock_matcher = automaton
+        except ImportError:
+            print("pyahocorasick not installed, using linear keyword scan")
         self._loaded = True
         self.model_name = "mock-llm"
     
     def _init_vllm(self):
         """Initialize vLLM for GPU inference"""
         try:
-            from vllm import LLM, SamplingParams
+            from vllm import AsyncEngineArgs, AsyncLLMEngine
             
             print(f"Loading vLLM model: {settings.vllm_model}")
-            self.model = LLM(
+            # The async engine continuously batches concurrent requests into shared forward passes
+            self.model = AsyncLLMEngine.from_engine_args(AsyncEngineArgs(
                 model=settings.vllm_model,
                 tensor_parallel_size=settings.vllm_tensor_parallel_size,
                 gpu_memory_utilization=settings.vllm_gpu_memory_utilization,
                 trust_remote_code=True
-            )
+            ))
+            self._loop = asyncio.get_running_loop()
+            try:
+                from transformers import AutoTokenizer
+                self._tokenizer = AutoTokenizer.from_pretrained(settings.vllm_model)
+            except Exception as e:
+                print(f"Warning: Could not load tokenizer, counting words instead: {e}")
             self.model_name = settings.vllm_model
             self._loaded = True
             print("vLLM model loaded successfully")
@@ -72,8 +111,8 @@ class LLMModel:
                 print(f"Loading llama.cpp model: {settings.llm_model_path}")
                 self.model = Llama(
                     model_path=settings.llm_model_path,
-                    n_ctx=4096,
-                    n_threads=4
+                    n_ctx=settings.llm_context_window,
+                    n_threads=settings.llm_n_threads
                 )
                 self.model_name = settings.llm_model_path.split("/")[-1]
                 self._loaded = True
@@ -90,13 +129,22 @@ class LLMModel:
     def is_loaded(self) -> bool:
         return self._loaded
     
+    def count_tokens(self, text: str) -> int:
+        """Count tokens with the backend's tokenizer (word count in mock mode)"""
+        if self.mode == "llamacpp":
+            return len(self.model.tokenize(text.encode(), add_bos=False))
+        if self.mode == "vllm" and self._tokenizer is not None:
+            return len(self._tokenizer.encode(text, add_special_tokens=False))
+        return len(text.split())
+    
     def generate(
         self,
         messages: List[Dict[str, str]],
         temperature: float = 0.7,
         max_tokens: int = 1024,
         top_p: float = 0.9,
-        stop: Optional[List[str]] = None
+        stop: Optional[List[str]] = None,
+        use_cache: bool = True
     ) -> Dict[str, Any]:
         """
         Generate completion for messages
@@ -107,10 +155,207 @@ class LLMModel:
             max_tokens: Maximum tokens to generate
             top_p: Top-p sampling
             stop: Stop sequences
+            use_cache: Consult the semantic response cache. It is keyed on the
+                last message only, so internal prompts that embed retrieved
+                context ahead of the question must pass False
             
         Returns:
             OpenAI-compatible response dict
         """
+        if self.response_cache is None or not use_cache:
+            return self._generate(messages, temperature, max_tokens, top_p, stop)
+        
+        prompt = messages[-1].get("content", "") if messages else ""
+        namespace = self._cache_namespace(messages, temperature, max_tokens, top_p, stop)
+        # An exact repeat of the prompt is answered without embedding it
+        cached = self.response_cache.lookup(prompt, namespace)
+        if cached is not None:
+            return {
+                **cached,
+                "id": f"chatcmpl-{uuid.uuid4().hex[:8]}",
+                "created": int(time.time())
+            }
+        
+        response = self._generate(messages, temperature, max_tokens, top_p, stop)
+        self.response_cache.insert(prompt, response, namespace)
+        return response
+    
+    async def agenerate(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 1024,
+        top_p: float = 0.9,
+        stop: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Awaitable generate that runs the blocking backend in a worker thread"""
+        if self.mode == "vllm" and self.response_cache is None:
+            return await self._agenerate_vllm(messages, temperature, max_tokens, top_p, stop)
+        
+        if self.mode == "llamacpp":
+            import anyio
+            
+            # Queue on a one-seat limiter so waiting requests don't each park a pool thread
+            if self._llamacpp_limiter is None:
+                self._llamacpp_limiter = anyio.CapacityLimiter(1)
+            return await anyio.to_thread.run_sync(
+                functools.partial(
+                    self.generate,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    top_p=top_p,
+                    stop=stop
+                ),
+                limiter=self._llamacpp_limiter
+            )
+        
+        return await asyncio.to_thread(
+            self.generate,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            top_p=top_p,
+            stop=stop
+        )
+    
+    async def astream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 1024,
+        top_p: float = 0.9,
+        stop: Optional[List[str]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream a completion as OpenAI `chat.completion.chunk` dicts
+        
+        The first chunk carries the assistant role, each following chunk a text
+        delta, and the last one the finish reason. Streaming bypasses the
+        response cache.
+        """
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:8]}"
+        created = int(time.time())
+        
+        def chunk(delta: Dict[str, str], finish_reason: Optional[str] = None) -> Dict[str, Any]:
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": self.model_name,
+                "choices": [{
+                    "index": 0,
+                    "delta": delta,
+                    "finish_reason": finish_reason
+                }]
+            }
+        
+        yield chunk({"role": "assistant"})
+        finish_reason = "stop"
+        async for text, reason in self._astream_text(messages, temperature, max_tokens, top_p, stop):
+            if text:
+                yield chunk({"content": text})
+            if reason:
+                finish_reason = reason
+        yield chunk({}, finish_reason)
+    
+    async def _astream_text(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        top_p: float,
+        stop: Optional[List[str]]
+    ) -> AsyncIterator[Tuple[str, Optional[str]]]:
+        """Yield (text delta, finish reason or None) pairs from the configured backend"""
+        if self.mode == "vllm":
+            from vllm import SamplingParams
+            
+            sampling_params = SamplingParams(
+                temperature=temperature,
+                max_tokens=max_tokens,
+                top_p=top_p,
+                stop=stop
+            )
+            # vLLM reports the cumulative text, so emit only what is new
+            sent = 0
+            async for output in self.model.generate(
+                self._format_messages(messages), sampling_params, request_id=uuid.uuid4().hex
+            ):
+                completion = output.outputs[0]
+                reason = None
+                if completion.finish_reason is not None:
+                    reason = "stop" if completion.finish_reason == "stop" else "length"
+                yield completion.text[sent:], reason
+                sent = len(completion.text)
+                
+        elif self.mode == "llamacpp":
+            # One worker thread drives the whole stream and owns the lock, so the
+            # context is only released once llama.cpp has really stopped decoding
+            loop = asyncio.get_running_loop()
+            queue: asyncio.Queue = asyncio.Queue()
+            cancelled = threading.Event()
+            prompt = self._format_messages(messages)
+            
+            def put(item):
+                try:
+                    loop.call_soon_threadsafe(queue.put_nowait, item)
+                except RuntimeError:
+                    pass  # Event loop already closed
+            
+            def produce():
+                try:
+                    # Tokens from two generations must not interleave on one context
+                    with self._llamacpp_lock:
+                        stream = self.model(
+                            prompt,
+                            max_tokens=max_tokens,
+                            temperature=temperature,
+                            top_p=top_p,
+                            stop=stop or [],
+                            stream=True
+                        )
+                        try:
+                            for part in stream:
+                                if cancelled.is_set():
+                                    break
+                                choice = part["choices"][0]
+                                put((choice["text"], choice.get("finish_reason")))
+                        finally:
+                            stream.close()
+                except Exception as e:
+                    put(e)
+                finally:
+                    put(None)
+            
+            loop.run_in_executor(None, produce)
+            try:
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+            finally:
+                # A disconnected client stops the producer after its current token
+                cancelled.set()
+                
+        else:
+            response = self._generate_mock(messages, temperature, max_tokens)
+            for word in re.findall(r"\S+\s*", response["choices"][0]["message"]["content"]):
+                yield word, None
+            yield "", "stop"
+    
+    def _generate(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        top_p: float,
+        stop: Optional[List[str]]
+    ) -> Dict[str, Any]:
+        """Dispatch generation to the configured backend"""
         if self.mode == "mock":
             return self._generate_mock(messages, temperature, max_tokens)
         elif self.mode == "vllm":
@@ -135,26 +380,14 @@ class LLMModel:
                 break
         
         # Generate a contextual mock response
-        mock_responses = {
-            "hello": "Hello! I'm a local AI assistant running on your machine. How can I help you today?",
-            "how are you": "I'm doing great! I'm a local LLM running in mock mode for demo purposes. I can help answer questions and have conversations.",
-            "what can you do": "I'm a local AI assistant. In production mode, I can run actual LLM inference using vLLM or llama.cpp. Currently running in mock mode for demo.",
-            "test": "Test successful! The AI Worker is running correctly. In production, this would use an actual LLM model.",
-        }
-        
-        # Check for keyword matches
-        response_text = None
-        user_lower = user_message.lower()
-        for keyword, response in mock_responses.items():
-            if keyword in user_lower:
-                response_text = response
-                break
+        response_text = self._match_mock_response(user_message.lower())
         
         if not response_text:
             response_text = f"I received your message: \"{user_message[:100]}{'...' if len(user_message) > 100 else ''}\"\n\nThis is a mock response from the AI Worker. In production mode with vLLM or llama.cpp, you would receive actual AI-generated responses."
         
-        # Simulate some latency
-        time.sleep(0.1)
+        # Rough word-count token usage, computed once
+        prompt_tokens = sum(len(m["content"].split()) for m in messages if m.get("content"))
+        completion_tokens = len(response_text.split())
         
         return {
             "id": f"chatcmpl-{uuid.uuid4().hex[:8]}",
@@ -170,12 +403,23 @@ class LLMModel:
                 "finish_reason": "stop"
             }],
             "usage": {
-                "prompt_tokens": sum(len(m.get("content", "").split()) for m in messages),
-                "completion_tokens": len(response_text.split()),
-                "total_tokens": sum(len(m.get("content", "").split()) for m in messages) + len(response_text.split())
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
             }
         }
     
+    def _match_mock_response(self, user_lower: str) -> Optional[str]:
+        """Return the canned reply for the highest-priority keyword in the message"""
+        if self._mock_matcher is not None:
+            matches = [value for _, value in self._mock_matcher.iter(user_lower)]
+            return min(matches)[1] if matches else None
+        
+        for keyword, response in MOCK_RESPONSES.items():
+            if keyword in user_lower:
+                return response
+        return None
+    
     def _generate_vllm(
         self,
         messages: List[Dict[str, str]],
@@ -184,7 +428,29 @@ class LLMModel:
         top_p: float,
         stop: Optional[List[str]]
     ) -> Dict[str, Any]:
-        """Generate using vLLM"""
+        """Generate using vLLM from a worker thread by scheduling on the engine's event loop"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            raise RuntimeError("vLLM generate() would block the event loop; use agenerate()")
+        
+        future = asyncio.run_coroutine_threadsafe(
+            self._agenerate_vllm(messages, temperature, max_tokens, top_p, stop),
+            self._loop
+        )
+        return future.result()
+    
+    async def _agenerate_vllm(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        top_p: float,
+        stop: Optional[List[str]]
+    ) -> Dict[str, Any]:
+        """Generate using the vLLM async engine"""
         from vllm import SamplingParams
         
         # Format messages into prompt
@@ -197,8 +463,11 @@ class LLMModel:
             stop=stop
         )
         
-        outputs = self.model.generate([prompt], sampling_params)
-        output = outputs[0]
+        output = None
+        async for output in self.model.generate(prompt, sampling_params, request_id=uuid.uuid4().hex):
+            pass
+        prompt_tokens = len(output.prompt_token_ids)
+        completion_tokens = len(output.outputs[0].token_ids)
         
         return {
             "id": f"chatcmpl-{uuid.uuid4().hex[:8]}",
@@ -214,9 +483,9 @@ class LLMModel:
                 "finish_reason": "stop" if output.outputs[0].finish_reason == "stop" else "length"
             }],
             "usage": {
-                "prompt_tokens": len(output.prompt_token_ids),
-                "completion_tokens": len(output.outputs[0].token_ids),
-                "total_tokens": len(output.prompt_token_ids) + len(output.outputs[0].token_ids)
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
             }
         }
     
@@ -231,13 +500,14 @@ class LLMModel:
         """Generate using llama.cpp"""
         prompt = self._format_messages(messages)
         
-        output = self.model(
-            prompt,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            top_p=top_p,
-            stop=stop or []
-        )
+        with self._llamacpp_lock:
+            output = self.model(
+                prompt,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                stop=stop or []
+            )
         
         return {
             "id": f"chatcmpl-{uuid.uuid4().hex[:8]}",
@@ -259,6 +529,21 @@ class LLMModel:
             })
         }
     
+    def _cache_namespace(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        top_p: float,
+        stop: Optional[List[str]]
+    ) -> str:
+        """Hash everything except the final message so only equivalent conversations share entries"""
+        digest = hashlib.blake2b(digest_size=16)
+        for msg in messages[:-1]:
+            digest.update(f"{msg.get('role', '')}\x00{msg.get('content', '')}\x00".encode())
+        digest.update(repr((temperature, max_tokens, top_p, stop)).encode())
+        return digest.hexdigest()
+    
     def _format_messages(self, messages: List[Dict[str, str]]) -> str:
         """Format messages into a prompt string"""
         prompt_parts = []
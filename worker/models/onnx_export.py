@@ -0,0 +1,63 @@
+"""
+ONNX export with dynamic INT8 weight quantization for HuggingFace models
+"""
+
+import os
+import shutil
+import tempfile
+from typing import Dict, List
+
+
+def export_int8_onnx(
+    model,
+    dummy_inputs: Dict[str, "torch.Tensor"],
+    input_names: List[str],
+    output_name: str,
+    output_axes: Dict[int, str],
+    onnx_path: str
+):
+    """
+    Export a HuggingFace model to ONNX (opset 14) and quantize weights to UINT8
+
+    Args:
+        model: The PyTorch model to export
+        dummy_inputs: Tokenizer output used to trace the graph
+        input_names: Inputs in the order of the model's forward() signature
+        output_name: Name of the single exported output
+        output_axes: Dynamic axes of the output, e.g. {0: "batch"}
+        onnx_path: Destination of the quantized model (ending in -int8.onnx)
+
+    Both files are written to a private temporary directory and the finished
+    model is moved into place atomically, so worker processes exporting at
+    the same time never read or delete each other's partial files.
+    """
+    import torch
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+    # Same directory as the destination, so the final rename stays on one filesystem
+    work_dir = tempfile.mkdtemp(dir=os.path.dirname(onnx_path), prefix=".export-")
+    try:
+        fp32_path = os.path.join(work_dir, "model.onnx")
+        int8_path = os.path.join(work_dir, "model-int8.onnx")
+
+        model.eval()
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                tuple(dummy_inputs[name] for name in input_names),
+                fp32_path,
+                input_names=input_names,
+                output_names=[output_name],
+                dynamic_axes={
+                    **{name: {0: "batch", 1: "sequence"} for name in input_names},
+                    output_name: output_axes
+                },
+                opset_version=14
+            )
+
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QUInt8)
+        os.replace(int8_path, onnx_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"Quantized ONNX model saved to {onnx_path}")
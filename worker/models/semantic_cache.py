@@ -0,0 +1,153 @@
+"""
+Semantic cache - reuses stored results for near-duplicate inputs
+"""
+
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Rows allocated for a namespace's first entries; doubled up to max_entries
+_INITIAL_ROWS = 64
+
+
+class _Namespace:
+    """
+    Embeddings and cached values for one namespace, kept in a ring buffer.
+    
+    Slot `start` holds the oldest entry and the next `size - 1` slots (mod
+    capacity) the newer ones, so inserting writes one row in place and
+    eviction only advances `start`.
+    """
+    
+    def __init__(self):
+        self.exact: Dict[str, Any] = {}
+        self.matrix: Optional[np.ndarray] = None
+        self.valid: Optional[np.ndarray] = None
+        self.texts: List[Optional[str]] = []
+        self.values: List[Any] = []
+        self.timestamps: List[float] = []
+        self.start = 0
+        self.size = 0
+    
+    @property
+    def capacity(self) -> int:
+        return 0 if self.matrix is None else len(self.matrix)
+
+
+class SemanticCache:
+    """
+    Cache keyed by embedding similarity.
+    
+    A lookup first checks for the exact input text (no embedding needed), then
+    embeds the input and returns the value stored for the most similar cached
+    input in the same namespace if the cosine similarity clears `threshold`.
+    Entries expire after `ttl` seconds and the oldest entries are evicted
+    beyond `max_entries` per namespace.
+    
+    Callers should pass `embedding` only when they already have it; otherwise
+    an exact hit is served without embedding at all. With a CachedEmbedder,
+    the embedding computed on a miss is reused by the following insert.
+    """
+    
+    def __init__(self, embedder, threshold: float = 0.95, ttl: float = 3600, max_entries: int = 1000):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._lock = threading.Lock()
+    
+    def embed(self, text: str) -> np.ndarray:
+        return self.embedder.encode(text)[0]
+    
+    def lookup(self, text: str, namespace: str = "", embedding: Optional[np.ndarray] = None) -> Optional[Any]:
+        """Return the cached value for the closest match, or None on a miss"""
+        if namespace not in self._namespaces:
+            return None
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if ns is None:
+                return None
+            self._evict_expired(ns)
+            if text in ns.exact:
+                return ns.exact[text]
+        if embedding is None:
+            embedding = self.embed(text)
+        
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if ns is None:
+                return None
+            self._evict_expired(ns)
+            if not ns.size:
+                return None
+            similarities = ns.matrix @ embedding.astype(np.float32)
+            similarities[~ns.valid] = -np.inf
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                return ns.values[best]
+        return None
+    
+    def insert(self, text: str, value: Any, namespace: str = "", embedding: Optional[np.ndarray] = None):
+        """Store a value under the embedding of `text`"""
+        if embedding is None:
+            embedding = self.embed(text)
+        with self._lock:
+            ns = self._namespaces.setdefault(namespace, _Namespace())
+            if ns.size == self.max_entries:
+                self._drop(ns, 1)
+            if ns.size == ns.capacity:
+                self._grow(ns, len(embedding))
+            slot = (ns.start + ns.size) % ns.capacity
+            ns.matrix[slot] = embedding
+            ns.valid[slot] = True
+            ns.texts[slot] = text
+            ns.values[slot] = value
+            ns.timestamps[slot] = time.monotonic()
+            ns.size += 1
+            ns.exact[text] = value
+    
+    def clear(self):
+        with self._lock:
+            self._namespaces.clear()
+    
+    def _grow(self, ns: _Namespace, dimension: int):
+        """Double the ring (up to max_entries), unrolling it so the oldest entry is in slot 0"""
+        capacity = min(max(2 * ns.capacity, _INITIAL_ROWS), self.max_entries)
+        order = [(ns.start + i) % ns.capacity for i in range(ns.size)] if ns.size else []
+        matrix = np.zeros((capacity, dimension), dtype=np.float32)
+        valid = np.zeros(capacity, dtype=bool)
+        if order:
+            matrix[:ns.size] = ns.matrix[order]
+            valid[:ns.size] = True
+        ns.texts = [ns.texts[i] for i in order] + [None] * (capacity - ns.size)
+        ns.values = [ns.values[i] for i in order] + [None] * (capacity - ns.size)
+        ns.timestamps = [ns.timestamps[i] for i in order] + [0.0] * (capacity - ns.size)
+        ns.matrix = matrix
+        ns.valid = valid
+        ns.start = 0
+    
+    def _evict_expired(self, ns: _Namespace):
+        cutoff = time.monotonic() - self.ttl
+        expired = 0
+        while expired < ns.size and ns.timestamps[(ns.start + expired) % ns.capacity] < cutoff:
+            expired += 1
+        if expired:
+            self._drop(ns, expired)
+    
+    @staticmethod
+    def _drop(ns: _Namespace, count: int):
+        """Drop the `count` oldest entries"""
+        for _ in range(count):
+            slot = ns.start
+            text, value = ns.texts[slot], ns.values[slot]
+            # A newer entry for the same text keeps its exact-match slot
+            if ns.exact.get(text) is value:
+                del ns.exact[text]
+            ns.valid[slot] = False
+            ns.texts[slot] = None
+            ns.values[slot] = None
+            ns.start = (slot + 1) % ns.capacity
+            ns.size -= 1
@@ -0,0 +1,131 @@
+"""
+BM25 keyword index over the indexed chunks
+"""
+
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Incremental Okapi BM25 index keyed by vector store document ids.
+
+    Each term keeps a posting list of (doc_id, term frequency), so a query
+    only touches the postings of its own terms. Documents can be added at any
+    time without rebuilding; IDF and the average length are computed at query
+    time from the running totals. Removal replaces the affected posting lists
+    rather than editing them, so searches can keep reading their snapshot.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self.clear()
+
+    def add_batch(self, doc_ids: List[int], texts: List[str]):
+        """Index texts under the given document ids"""
+        with self._lock:
+            for doc_id, text in zip(doc_ids, texts):
+                counts = Counter(tokenize(text))
+                length = sum(counts.values())
+                if doc_id >= len(self._lengths):
+                    self._lengths.extend([0] * (doc_id + 1 - len(self._lengths)))
+                self._lengths[doc_id] = length
+                self._total_length += length
+                self._num_docs += 1
+                for term, tf in counts.items():
+                    ids, tfs = self._postings.setdefault(term, ([], []))
+                    ids.append(doc_id)
+                    tfs.append(tf)
+
+    def remove(self, doc_ids: List[int], texts: List[str]):
+        """Remove documents, given the texts they were indexed with"""
+        with self._lock:
+            for doc_id, text in zip(doc_ids, texts):
+                counts = Counter(tokenize(text))
+                self._total_length -= self._lengths[doc_id]
+                self._lengths[doc_id] = 0
+                self._num_docs -= 1
+                for term in counts:
+                    ids, tfs = self._postings[term]
+                    keep = [i for i, posting_id in enumerate(ids) if posting_id != doc_id]
+                    if keep:
+                        self._postings[term] = ([ids[i] for i in keep], [tfs[i] for i in keep])
+                    else:
+                        del self._postings[term]
+
+    def rebuild(self, doc_ids: List[int], texts: List[str]):
+        """Replace the whole index, e.g. after the vector store renumbered its ids"""
+        fresh = BM25Index(self.k1, self.b)
+        fresh.add_batch(doc_ids, texts)
+        with self._lock:
+            self._postings = fresh._postings
+            self._lengths = fresh._lengths
+            self._total_length = fresh._total_length
+            self._num_docs = fresh._num_docs
+
+    def search_batch(self, queries: List[str], top_k: int) -> List[List[Tuple[int, float]]]:
+        """
+        Score every query against the index
+
+        Returns:
+            One list of (doc_id, bm25_score) per query, best first
+        """
+        with self._lock:
+            if self._num_docs == 0:
+                return [[] for _ in queries]
+            lengths = np.asarray(self._lengths, dtype=np.float32)
+            avg_length = self._total_length / self._num_docs
+            # Per-document length normalization, shared by every term
+            norm = self.k1 * (1 - self.b + self.b * lengths / avg_length)
+            # Record each posting list's current length; concurrent adds only append
+            postings = []
+            for query in queries:
+                query_postings = []
+                for term in set(tokenize(query)):
+                    posting = self._postings.get(term)
+                    if posting is not None:
+                        query_postings.append((posting, len(posting[0])))
+                postings.append(query_postings)
+            num_docs = self._num_docs
+
+        results = []
+        for query_postings in postings:
+            accumulated = np.zeros(len(lengths), dtype=np.float32)
+            touched = []
+            for (doc_ids, tfs), df in query_postings:
+                ids = np.asarray(doc_ids[:df], dtype=np.int64)
+                tfs = np.asarray(tfs[:df], dtype=np.float32)
+                idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+                accumulated[ids] += idf * tfs * (self.k1 + 1) / (tfs + norm[ids])
+                touched.append(ids)
+            if not touched:
+                results.append([])
+                continue
+            candidates = np.unique(np.concatenate(touched))
+            candidate_scores = accumulated[candidates]
+            k = min(top_k, len(candidates))
+            best = np.argpartition(-candidate_scores, k - 1)[:k]
+            best = best[np.argsort(-candidate_scores[best], kind="stable")]
+            results.append([(int(candidates[i]), float(candidate_scores[i])) for i in best])
+        return results
+
+    def clear(self):
+        """Clear all postings"""
+        with self._lock:
+            self._postings: Dict[str, Tuple[List[int], List[int]]] = {}
+            self._lengths: List[int] = []
+            self._total_length = 0
+            self._num_docs = 0
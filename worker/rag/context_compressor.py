@@ -3,6 +3,8 @@ Context Compressor Module
 """
 from typing import List, Dict, Any
 
+import numpy as np
+
 class ContextCompressor:
     """
     Compresses the context by extracting the most relevant sentences from documents.
@@ -12,7 +14,13 @@ class ContextCompressor:
         # A simple default sentence splitter
         self.sentence_splitter = sentence_splitter or (lambda text: text.split('. '))
 
-    def compress(self, query: str, documents: List[Dict[str, Any]], max_sentences_per_doc: int = 3) -> List[Dict[str, Any]]:
+    def compress(
+        self,
+        query: str,
+        documents: List[Dict[str, Any]],
+        max_sentences_per_doc: int = 3,
+        precomputed_scores: bool = False
+    ) -> List[Dict[str, Any]]:
         """
         Compresses a list of documents based on a query.
 
@@ -20,6 +28,9 @@ class ContextCompressor:
             query: The user's query.
             documents: The list of documents retrieved from the reranker.
             max_sentences_per_doc: The maximum number of relevant sentences to keep from each document.
+            precomputed_scores: Documents carrying a `rerank_score` were already scored
+                against the query; those with no more than `max_sentences_per_doc`
+                sentences are kept whole instead of being re-scored sentence by sentence.
 
         Returns:
             A list of documents with their content compressed to the most relevant sentences.
@@ -28,29 +39,48 @@ class ContextCompressor:
             print("Warning: Reranker not available for context compression. Skipping.")
             return documents
 
-        compressed_docs = []
+        # 1. Split every document into sentences, remembering where its pairs start;
+        #    repeated contents share the pairs of their first occurrence
+        all_pairs = []
+        offsets = []
+        scored = {}
         for doc in documents:
             content = doc.get('content', '')
-            if not content:
+            sentences = self.sentence_splitter(content) if content else []
+            if (precomputed_scores and 'rerank_score' in doc
+                    and len(sentences) <= max_sentences_per_doc):
+                # Every sentence survives anyway, so the cross-encoder pass would be wasted
+                offsets.append((None, sentences))
                 continue
+            if content not in scored:
+                scored[content] = (len(all_pairs), sentences)
+                all_pairs.extend([query, s] for s in sentences)
+            offsets.append(scored[content])
 
-            # 1. Split the document content into sentences
-            sentences = self.sentence_splitter(content)
-            if not sentences:
-                continue
+        if not any(sentences for _, sentences in offsets):
+            return []
 
-            # 2. Score each sentence against the query
-            pairs = [[query, s] for s in sentences]
-            scores = self.reranker.model.predict(pairs, show_progress_bar=False)
+        # 2. Score the sentences of all documents against the query in one batched call
+        scores = None
+        if all_pairs:
+            scores = self.reranker.predict(all_pairs, batch_size=64)
 
-            # 3. Combine sentences with their scores
-            scored_sentences = list(zip(sentences, scores))
+        compressed_docs = []
+        for doc, (start, sentences) in zip(documents, offsets):
+            if not sentences:
+                continue
 
-            # 4. Sort sentences by score and select the top ones
-            scored_sentences.sort(key=lambda x: x[1], reverse=True)
-            top_sentences = [s[0] for s in scored_sentences[:max_sentences_per_doc]]
+            if start is None:
+                top_sentences = sentences
+            else:
+                # 3. Select the top-k sentences in O(n), then order just those k by score
+                doc_scores = scores[start:start + len(sentences)]
+                k = min(max_sentences_per_doc, len(sentences))
+                top = np.argpartition(-doc_scores, k - 1)[:k]
+                top = top[np.argsort(-doc_scores[top], kind="stable")]
+                top_sentences = [sentences[i] for i in top]
 
-            # 5. Create a new compressed document
+            # 4. Create a new compressed document
             new_doc = doc.copy()
             new_doc['content'] = ". ".join(top_sentences)
             # Optionally, add original content for reference
@@ -25,10 +25,14 @@ class FactChecker:
             print("Warning: LLM model not available for fact checking. Skipping.")
             return {"status": "skipped", "reason": "LLM not available"}
 
-        # Combine context into a single string
+        # Combine context into a single string, each distinct content once under
+        # every source number it had in the prompt, so citations still match
+        numbers: Dict[str, List[str]] = {}
+        for i, doc in enumerate(context_docs):
+            numbers.setdefault(doc.get('content', ''), []).append(str(i + 1))
         context_text = "\n\n".join([
-            f"[Source {i+1}]: {doc.get('content', '')}"
-            for i, doc in enumerate(context_docs)
+            f"[Source {', '.join(ids)}]: {content}"
+            for content, ids in numbers.items()
         ])
 
         prompt = f"""You are a strict fact-checker. Your task is to verify if the following answer is fully supported by the provided context.
@@ -69,7 +73,8 @@ Return ONLY the JSON object.
             response = self.llm_model.generate(
                 messages=messages,
                 temperature=0.1, # Low temperature for consistent analysis
-                max_tokens=512
+                max_tokens=512,
+                use_cache=False  # The prompt leads with the context, see LLMModel.generate
             )
             content = response["choices"][0]["message"]["content"]
 
@@ -2,13 +2,22 @@
 RAG Pipeline - combines retrieval and generation
 """
 
-from typing import List, Dict, Any, Optional
+import asyncio
+import hashlib
+import re
+import threading
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+
+import numpy as np
 from rag.vector_store import VectorStore
+from rag.bm25 import BM25Index
 from rag.query_expansion import QueryExpansion
 from rag.reranker import Reranker
 from rag.context_compressor import ContextCompressor
 from rag.fact_checker import FactChecker
 
+_WORD_RE = re.compile(r"\S+")
+
 
 class RAGPipeline:
     """
@@ -20,14 +29,53 @@ class RAGPipeline:
     5. Fact-check the response against the context
     """
     
-    def __init__(self, embedding_model, llm_model, reranker_model, dimension: int = 384):
+    def __init__(
+        self,
+        embedding_model,
+        llm_model,
+        reranker_model,
+        dimension: int = 384,
+        batch_size: int = 64,
+        index_type: str = "auto",
+        storage: str = "float32",
+        nprobe: int = 16,
+        hnsw_m: int = 32,
+        ef_construction: int = 200,
+        ef_search: int = 64,
+        response_cache=None,
+        context_window: int = 4096,
+        search_cache=None,
+        hybrid_alpha: float = 1.0
+    ):
         self.embedding_model = embedding_model
+        self.batch_size = batch_size
+        self.context_window = context_window
         self.llm_model = llm_model
-        self.vector_store = VectorStore(dimension=dimension)
+        self.vector_store = VectorStore(
+            dimension=dimension,
+            hnsw_m=hnsw_m,
+            ef_construction=ef_construction,
+            ef_search=ef_search,
+            index_type=index_type,
+            storage=storage,
+            nprobe=nprobe
+        )
+        # Keyword index over the same chunks, blended with dense scores when alpha < 1.
+        # Dense-only deployments never build it; otherwise it is built up front, or
+        # on the first query asking for a per-request alpha < 1
+        self.bm25_index: Optional[BM25Index] = BM25Index() if hybrid_alpha < 1 else None
+        # Serializes corpus changes with the keyword index, so a lazy build sees
+        # exactly the documents that later adds and deletes are applied on top of
+        self._keyword_lock = threading.RLock()
+        self.hybrid_alpha = hybrid_alpha
         self.query_expander = QueryExpansion(llm_model)
         self.reranker = reranker_model
         self.context_compressor = ContextCompressor(reranker_model)
         self.fact_checker = FactChecker(llm_model)
+        # Optional SemanticCache of full query results, reused for paraphrased queries
+        self.response_cache = response_cache
+        # Optional SemanticCache of reranked retrieval results
+        self.search_cache = search_cache
 
     def index_documents(
         self, 
@@ -46,70 +94,261 @@ class RAGPipeline:
         Returns:
             Number of chunks indexed
         """
-        indexed = 0
+        chunks = []
+        payloads = []
         
         for doc in documents:
             content = doc.get("content", "")
             metadata = doc.get("metadata", {})
             
             # Chunk the content
-            chunks = self._chunk_text(content, chunk_size, chunk_overlap)
-            
-            for i, chunk in enumerate(chunks):
-                # Generate embedding
-                embedding = self.embedding_model.encode(chunk)[0]
-                
-                # Store in vector store
-                self.vector_store.add(
-                    embedding,
-                    {
-                        "content": chunk,
-                        "metadata": {
-                            **metadata,
-                            "chunk_index": i
-                        }
+            for i, chunk in enumerate(self._chunk_text(content, chunk_size, chunk_overlap)):
+                chunks.append(chunk)
+                payloads.append({
+                    "content": chunk,
+                    "metadata": {
+                        **metadata,
+                        "chunk_index": i
                     }
-                )
-                indexed += 1
+                })
+        
+        if not chunks:
+            return 0
+        
+        # Embed each distinct chunk once, in batched forward passes
+        unique_index: Dict[bytes, int] = {}
+        unique_chunks = []
+        chunk_rows = []
+        for chunk in chunks:
+            key = hashlib.blake2b(chunk.encode(), digest_size=16).digest()
+            row = unique_index.get(key)
+            if row is None:
+                row = unique_index[key] = len(unique_chunks)
+                unique_chunks.append(chunk)
+            chunk_rows.append(row)
+        
+        embeddings = self.embedding_model.encode(unique_chunks, batch_size=self.batch_size)
         
-        return indexed
+        # Store in vector store, fanning shared embeddings out to every occurrence
+        with self._keyword_lock:
+            doc_ids = self.vector_store.add_batch(embeddings[chunk_rows], payloads)
+            if self.bm25_index is not None:
+                self.bm25_index.add_batch(doc_ids, chunks)
+        
+        # Cached answers may no longer reflect the corpus
+        self._clear_caches()
+        
+        return len(chunks)
     
-    def retrieve(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    def retrieve(
+        self,
+        query: str,
+        top_k: int = 5,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        nprobe: Optional[int] = None,
+        candidates: Optional[int] = None,
+        alpha: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
         """
         Retrieve relevant documents for a query using expansion and reranking.
         
         Args:
             query: Search query
             top_k: Number of final results to return
+            metadata_filter: Keep only documents whose metadata matches every key/value
+            nprobe: IVF cells to search with the "ivfpq" index (recall/latency trade-off)
+            candidates: Vector search hits the cross-encoder reranks (default
+                5 * top_k); equal to top_k skips reranking altogether
+            alpha: Weight of the dense score against BM25 when ranking candidates
+                (1 = dense only, 0 = keywords only; default `hybrid_alpha`)
             
         Returns:
             List of relevant documents with scores
         """
-        # 1. Expand the query
-        expanded_queries = self.query_expander.expand(query)
+        count, alpha = self.retrieval_params(top_k, candidates, alpha)
+        cached = self.lookup_retrieval(query, top_k, metadata_filter, nprobe, count, alpha)
+        if cached is not None:
+            return cached
         
-        # 2. Retrieve for each query
-        retrieved_docs = {}
-        # We retrieve more documents initially to give the reranker more to work with
-        initial_k = top_k * 5
-
-        for q in expanded_queries:
-            query_embedding = self.embedding_model.encode(q)[0]
-            results = self.vector_store.search(query_embedding, initial_k)
-            for doc_id, score, doc in results:
-                if doc_id not in retrieved_docs and doc is not None:
-                    retrieved_docs[doc_id] = {
-                        "id": doc_id,
-                        "content": doc.get("content", ""),
-                        "score": score,
-                        "metadata": doc.get("metadata", {})
-                    }
+        expansions = self.query_expander.expand(query)
+        docs = self.search_candidates([query], [expansions], [metadata_filter], [count], [alpha], nprobe)[0]
+        return self.finish_retrieval(query, docs, top_k, metadata_filter, nprobe, count, alpha)
         
-        # 3. Rerank the collected documents
-        all_docs = list(retrieved_docs.values())
-        reranked_docs = self.reranker.rerank(query, all_docs, top_k)
-
-        return reranked_docs
+    # Retrieval stages. `retrieve` runs them in order; RetrievalBatcher runs the
+    # same stages per request but shares search_candidates between requests.
+    
+    def retrieval_params(self, top_k: int, candidates: Optional[int], alpha: Optional[float]) -> Tuple[int, float]:
+        """Candidates to fetch (default 5 * top_k, never fewer than top_k) and dense weight (default `hybrid_alpha`)"""
+        return max(candidates or top_k * 5, top_k), self.hybrid_alpha if alpha is None else alpha
+    
+    def lookup_retrieval(
+        self,
+        query: str,
+        top_k: int,
+        metadata_filter: Optional[Dict[str, Any]],
+        nprobe: Optional[int],
+        count: int,
+        alpha: float
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Reranked results of an exact or near-duplicate earlier query, if the search cache has them"""
+        if self.search_cache is None:
+            return None
+        namespace = self._search_namespace(top_k, metadata_filter, nprobe, count, alpha)
+        cached = self.search_cache.lookup(query, namespace)
+        return list(cached) if cached is not None else None
+    
+    def finish_retrieval(
+        self,
+        query: str,
+        docs: List[Dict[str, Any]],
+        top_k: int,
+        metadata_filter: Optional[Dict[str, Any]],
+        nprobe: Optional[int],
+        count: int,
+        alpha: float
+    ) -> List[Dict[str, Any]]:
+        """Rerank the candidates of one query down to top_k and store them in the search cache"""
+        # Skip the cross-encoder when no more candidates were fetched than are returned
+        if count <= top_k:
+            results = docs[:top_k]
+        else:
+            results = self.reranker.rerank(query, docs, top_k)
+        if self.search_cache is not None:
+            namespace = self._search_namespace(top_k, metadata_filter, nprobe, count, alpha)
+            self.search_cache.insert(query, results, namespace)
+            results = list(results)
+        return results
+    
+    def search_candidates(
+        self,
+        queries: List[str],
+        expansions: List[List[str]],
+        metadata_filters: List[Optional[Dict[str, Any]]],
+        candidates: List[int],
+        alphas: List[float],
+        nprobe: Optional[int] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Candidate documents for several queries, sharing one embedding call and one search
+        
+        Every expansion of every query is embedded in one forward pass and
+        searched in one call; the original queries were usually embedded just
+        before by the search cache lookup, and the CachedEmbedder serves those
+        rows without running the model. Per query, hits are merged across its
+        expansions, blended with BM25 when its alpha < 1, filtered and capped
+        at its candidate count.
+        
+        Returns:
+            One best-first list of candidate documents per query
+        """
+        # 1. Flatten the expansions, remembering which rows belong to which query
+        expanded_queries = []
+        owners = []
+        for i, texts in enumerate(expansions):
+            expanded_queries.extend(texts)
+            owners.extend([i] * len(texts))
+        
+        # 2. Embed all expanded queries in one forward pass and search them in one call
+        embeddings = self.embedding_model.encode(expanded_queries, batch_size=self.batch_size)
+        batch_results = self.vector_store.search_batch(embeddings, max(candidates), nprobe=nprobe)
+        
+        hits_per_query: List[List[tuple]] = [[] for _ in queries]
+        for owner, results in zip(owners, batch_results):
+            hits_per_query[owner].extend(results[:candidates[owner]])
+        
+        # Keyword hits for the original queries that blend in BM25
+        hybrid = [i for i, alpha in enumerate(alphas) if alpha < 1]
+        keyword_hits: List[List[Tuple[int, float]]] = [[] for _ in queries]
+        if hybrid:
+            sparse = self._keyword_index().search_batch([queries[i] for i in hybrid], max(candidates[i] for i in hybrid))
+            for i, hits in zip(hybrid, sparse):
+                keyword_hits[i] = hits[:candidates[i]]
+        
+        results = []
+        for metadata_filter, count, alpha, hits, sparse_hits in zip(
+            metadata_filters, candidates, alphas, hits_per_query, keyword_hits
+        ):
+            all_docs = self._dedupe_hits(hits)
+            if alpha < 1:
+                all_docs = self._blend(all_docs, sparse_hits, alpha)
+            if metadata_filter:
+                all_docs = [
+                    doc for doc in all_docs
+                    if all(doc["metadata"].get(key) == value for key, value in metadata_filter.items())
+                ]
+            # Union over expansions is best-first; cap it so cross-encoder work stays bounded
+            results.append(all_docs[:count])
+            
+        return results
+        
+    @staticmethod
+    def _search_namespace(
+        top_k: int,
+        metadata_filter: Optional[Dict[str, Any]],
+        nprobe: Optional[int],
+        count: int,
+        alpha: float
+    ) -> str:
+        """Search cache namespace: results are only shared between identical retrieval settings"""
+        return repr((top_k, sorted((metadata_filter or {}).items()), nprobe, count, alpha))
+    
+    def _blend(
+        self,
+        dense_docs: List[Dict[str, Any]],
+        sparse_hits: List[Tuple[int, float]],
+        alpha: float
+    ) -> List[Dict[str, Any]]:
+        """
+        Rank the union of dense and BM25 hits by alpha * dense + (1 - alpha) * bm25
+        
+        Each score set is min-max normalized first; a document missing from
+        one retriever scores 0 there. `score` becomes the blended score.
+        """
+        docs = {doc["id"]: doc for doc in dense_docs}
+        stored = self.vector_store.documents
+        for doc_id, _ in sparse_hits:
+            if doc_id in docs or doc_id >= len(stored) or stored[doc_id] is None:
+                continue
+            docs[doc_id] = {
+                "id": doc_id,
+                "content": stored[doc_id].get("content", ""),
+                "score": 0.0,
+                "metadata": stored[doc_id].get("metadata", {})
+            }
+        
+        def normalized(scores: Dict[int, float]) -> Dict[int, float]:
+            if not scores:
+                return {}
+            low, high = min(scores.values()), max(scores.values())
+            span = high - low
+            return {doc_id: (score - low) / span if span > 0 else 1.0 for doc_id, score in scores.items()}
+        
+        dense = normalized({doc["id"]: doc["score"] for doc in dense_docs})
+        sparse = normalized(dict(sparse_hits))
+        for doc_id, doc in docs.items():
+            doc["score"] = alpha * dense.get(doc_id, 0.0) + (1 - alpha) * sparse.get(doc_id, 0.0)
+        return sorted(docs.values(), key=lambda doc: doc["score"], reverse=True)
+    
+    def _dedupe_hits(self, hits: List[tuple]) -> List[Dict[str, Any]]:
+        """Collapse (doc_id, score, doc) hits across expansions, keeping each document's best score"""
+        if not hits:
+            return []
+        ids = np.fromiter((doc_id for doc_id, _, _ in hits), dtype=np.int64, count=len(hits))
+        scores = np.fromiter((score for _, score, _ in hits), dtype=np.float32, count=len(hits))
+        order = np.argsort(-scores, kind="stable")
+        _, first = np.unique(ids[order], return_index=True)
+        best = np.sort(first)  # positions in `order`, so still best score first
+        
+        all_docs = []
+        for i in order[best]:
+            doc_id, score, doc = hits[i]
+            all_docs.append({
+                "id": doc_id,
+                "content": doc.get("content", ""),
+                "score": score,
+                "metadata": doc.get("metadata", {})
+            })
+        return all_docs
     
     def query(
         self, 
@@ -119,7 +358,9 @@ class RAGPipeline:
         use_fact_checking: bool = True, # New flag for fact checking
         system_prompt: Optional[str] = None,
         temperature: float = 0.7,
-        max_tokens: int = 1024
+        max_tokens: int = 1024,
+        max_context_tokens: Optional[int] = None,
+        sources: Optional[List[Dict[str, Any]]] = None
     ) -> Dict[str, Any]:
         """
         Full RAG query: retrieve, compress, generate, and fact-check response
@@ -132,49 +373,42 @@ class RAGPipeline:
             system_prompt: Optional system prompt
             temperature: Generation temperature
             max_tokens: Max tokens to generate
+            max_context_tokens: Token budget for the sources in the prompt; defaults
+                to what the context window leaves after max_tokens and the template
+            sources: Already retrieved documents for this query (e.g. from
+                RetrievalBatcher); retrieval is skipped when given
             
         Returns:
             Response with answer, sources, and fact-checking analysis
         """
-        # 1. Retrieve relevant context
-        sources = self.retrieve(query, top_k)
+        # 0. Reuse the result of a sufficiently similar earlier query
+        if self.response_cache is not None:
+            namespace = repr((
+                top_k, use_compression, use_fact_checking, system_prompt,
+                temperature, max_tokens, max_context_tokens
+            ))
+            # The query is only embedded on an exact-text miss
+            cached = self.response_cache.lookup(query, namespace)
+            if cached is not None:
+                return cached
         
-        # 2. (Optional) Compress the context
-        if use_compression:
-            context_for_generation = self.context_compressor.compress(query, sources)
-        else:
-            context_for_generation = sources
-
-        # 3. Build context string
-        context = "\n\n".join([
-            f"[Source {i+1}]: {src['content']}"
-            for i, src in enumerate(context_for_generation)
-        ])
+        # 1. Retrieve relevant context
+        if sources is None:
+            sources = self.retrieve(query, top_k)
         
-        # 4. Build messages
-        system = system_prompt or (
-            "You are a helpful assistant that answers questions based on the provided context. "
-            "If the context doesn't contain relevant information, say so clearly. "
-            "Always cite which source(s) you used."
+        # 2-4. Compress the context and build the prompt
+        messages, context_for_generation = self._build_messages(
+            query, sources, use_compression, system_prompt, max_tokens, max_context_tokens
         )
         
-        user_message = f"""Context:
-{context}
-
-Question: {query}
-
-Please answer based on the context above."""
-        
-        messages = [
-            {"role": "system", "content": system},
-            {"role": "user", "content": user_message}
-        ]
-        
         # 5. Generate response
         response = self.llm_model.generate(
             messages=messages,
             temperature=temperature,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            # Prompts differing only after the shared context would collide; the
+            # pipeline's own response cache is keyed on the query instead
+            use_cache=False
         )
 
         answer = response["choices"][0]["message"]["content"]
@@ -184,37 +418,225 @@ Please answer based on the context above."""
         if use_fact_checking:
             fact_check_result = self.fact_checker.check(answer, context_for_generation)
 
-        return {
+        result = {
             "answer": answer,
             "sources": sources, # Return original, uncompressed sources
             "model": response["model"],
             "fact_check": fact_check_result
         }
+        if self.response_cache is not None:
+            self.response_cache.insert(query, result, namespace)
+        return result
+    
+    async def query_stream(
+        self,
+        query: str,
+        top_k: int = 5,
+        use_compression: bool = True,
+        use_fact_checking: bool = True,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 1024,
+        max_context_tokens: Optional[int] = None,
+        sources: Optional[List[Dict[str, Any]]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of `query`, yielding events as they become available
+        
+        Yields {"sources": [...]} once retrieval is done, then {"token": str} for
+        each generated text delta, and finally {"model": str, "fact_check": ...}.
+        Streamed answers bypass the response cache.
+        """
+        if sources is None:
+            sources = await asyncio.to_thread(self.retrieve, query, top_k)
+        yield {"sources": sources}
+        
+        messages, context_for_generation = await asyncio.to_thread(
+            self._build_messages,
+            query, sources, use_compression, system_prompt, max_tokens, max_context_tokens
+        )
+        
+        parts = []
+        async for chunk in self.llm_model.astream(
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        ):
+            token = chunk["choices"][0]["delta"].get("content")
+            if token:
+                parts.append(token)
+                yield {"token": token}
+        
+        fact_check_result = None
+        if use_fact_checking:
+            fact_check_result = await asyncio.to_thread(
+                self.fact_checker.check, "".join(parts), context_for_generation
+            )
+        yield {"model": self.llm_model.model_name, "fact_check": fact_check_result}
+    
+    def _build_messages(
+        self,
+        query: str,
+        sources: List[Dict[str, Any]],
+        use_compression: bool,
+        system_prompt: Optional[str],
+        max_tokens: int,
+        max_context_tokens: Optional[int]
+    ) -> Tuple[List[Dict[str, str]], List[Dict[str, Any]]]:
+        """
+        Compress the sources and fit them into the prompt
+        
+        Returns:
+            The chat messages and the sources that made it into the context
+        """
+        # (Optional) Compress the context
+        if use_compression:
+            # Sources were just reranked against this query, so short ones need no re-scoring
+            context_for_generation = self.context_compressor.compress(query, sources, precomputed_scores=True)
+        else:
+            context_for_generation = sources
+        
+        # Build context string, adding sources in rank order while they fit the budget
+        budget = max_context_tokens or max(self.context_window - max_tokens - 256, 0)
+        parts = []
+        used = 0
+        for i, src in enumerate(context_for_generation):
+            prefix = f"[Source {i+1}]: "
+            part = prefix + src['content']
+            tokens = self.llm_model.count_tokens(part)
+            if used + tokens > budget:
+                if parts:
+                    break
+                # Even the best source alone overflows: keep as much of it as fits
+                part = self._truncate_to_tokens(part, budget)
+                if not part[len(prefix):].strip():
+                    break
+                context_for_generation = [{**src, "content": part[len(prefix):]}] + context_for_generation[1:]
+                tokens = self.llm_model.count_tokens(part)
+            parts.append(part)
+            used += tokens
+        context_for_generation = context_for_generation[:len(parts)]
+        context = "\n\n".join(parts)
+        
+        # Build messages
+        system = system_prompt or (
+            "You are a helpful assistant that answers questions based on the provided context. "
+            "If the context doesn't contain relevant information, say so clearly. "
+            "Always cite which source(s) you used."
+        )
+        
+        user_message = f"""Context:
+{context}
+
+Question: {query}
+
+Please answer based on the context above."""
+
+        messages = [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user_message}
+        ]
+        return messages, context_for_generation
+    
+    def delete(self, doc_id: int) -> bool:
+        """Delete one chunk from the vector store and the keyword index"""
+        with self._keyword_lock:
+            documents = self.vector_store.documents
+            document = documents[doc_id] if 0 <= doc_id < len(documents) else None
+            if document is None or not self.vector_store.delete(doc_id):
+                return False
+            if self.bm25_index is not None:
+                self.bm25_index.remove([doc_id], [document.get("content", "")])
+        self._clear_caches()
+        return True
+    
+    def compact(self, min_dead_fraction: float = 0.25) -> bool:
+        """Drop deleted chunks from the vector store, renumbering the keyword index to match"""
+        with self._keyword_lock:
+            compacted = self.vector_store.compact(min_dead_fraction, on_compacted=self._rebuild_keyword_index)
+        if compacted is None:
+            return False
+        # Cached results refer to the old ids
+        self._clear_caches()
+        return True
+    
+    def _rebuild_keyword_index(self):
+        if self.bm25_index is not None:
+            self.bm25_index.rebuild(*self._live_documents())
+    
+    def _keyword_index(self) -> BM25Index:
+        """The BM25 index, built from the stored chunks on first use"""
+        with self._keyword_lock:
+            if self.bm25_index is None:
+                index = BM25Index()
+                index.add_batch(*self._live_documents())
+                self.bm25_index = index
+            return self.bm25_index
+    
+    def _live_documents(self) -> Tuple[List[int], List[str]]:
+        """Ids and texts of the chunks that have not been deleted"""
+        documents = [doc for doc in self.vector_store.documents if doc is not None]
+        return [doc["id"] for doc in documents], [doc.get("content", "") for doc in documents]
+    
+    def _truncate_to_tokens(self, text: str, budget: int) -> str:
+        """Longest word-boundary prefix of `text` within `budget` tokens (binary search on count_tokens)"""
+        ends = [match.end() for match in _WORD_RE.finditer(text)]
+        low, high = 0, len(ends)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.llm_model.count_tokens(text[:ends[middle - 1]]) <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:ends[low - 1]] if low else ""
     
     def clear(self):
         """Clear the index"""
-        self.vector_store.clear()
+        with self._keyword_lock:
+            self.vector_store.clear()
+            if self.bm25_index is not None:
+                self.bm25_index.clear()
+        self._clear_caches()
+    
+    def _clear_caches(self):
+        """Drop cached results, which may no longer reflect the corpus"""
+        for cache in (self.response_cache, self.search_cache):
+            if cache is not None:
+                cache.clear()
     
     def stats(self) -> Dict[str, Any]:
         """Get pipeline statistics"""
-        return {
+        stats = {
             "total_documents": self.vector_store.count(),
-            "dimension": self.vector_store.dimension
+            "dimension": self.vector_store.dimension,
+            "index_type": self.vector_store.index_type
         }
+        if hasattr(self.embedding_model, "cache_stats"):
+            stats["embedding_cache"] = self.embedding_model.cache_stats()
+        return stats
     
     def _chunk_text(self, text: str, chunk_size: int, overlap: int) -> List[str]:
-        """Split text into overlapping chunks"""
-        words = text.split()
-        chunks = []
+        """Split text into overlapping chunks of words, sliced from the original string"""
+        # Character offsets of every word, found in a single pass
+        starts = []
+        ends = []
+        for match in _WORD_RE.finditer(text):
+            starts.append(match.start())
+            ends.append(match.end())
         
-        if len(words) <= chunk_size:
+        num_words = len(starts)
+        if num_words == 0:
+            return []
+        if num_words <= chunk_size:
             return [text]
         
-        start = 0
-        while start < len(words):
-            end = start + chunk_size
-            chunk = " ".join(words[start:end])
-            chunks.append(chunk)
-            start = end - overlap
+        # Always advance by at least one word, even if overlap >= chunk_size
+        stride = max(chunk_size - overlap, 1)
+        chunks = []
+        for start in range(0, num_words, stride):
+            end = min(start + chunk_size, num_words)
+            chunks.append(text[starts[start]:ends[end - 1]])
+            if end == num_words:
+                break
         
         return chunks
@@ -1,14 +1,36 @@
 """
 Query Expansion Module
 """
-from typing import List, Dict, Any
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Tuple
+
+_PROMPT_TEMPLATE = """You are an expert in information retrieval. Your task is to expand a user's query to improve search results.
+Generate {n} alternative queries that are semantically related to the original query.
+The queries should be diverse and cover different aspects or phrasings of the original topic.
+Return ONLY a numbered list of the new queries. Do not include the original query.
+
+Original Query: "{q}"
+"""
+
+# "1. query", "2) query", ... one per line
+_LIST_ITEM_RE = re.compile(r"^\s*\d+[\.\)]\s*(.+)$", re.M)
 
 class QueryExpansion:
     """
     Expands a user query into multiple related queries using an LLM.
+
+    Queries shorter than `min_words` words are returned as-is, since
+    expanding them rarely improves recall, and results for recent queries
+    are kept in a small LRU cache so repeated queries skip the LLM call.
     """
-    def __init__(self, llm_model: Any):
+    def __init__(self, llm_model: Any, min_words: int = 4, cache_size: int = 1024):
         self.llm_model = llm_model
+        self.min_words = min_words
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, int], List[str]]" = OrderedDict()
+        self._lock = threading.Lock()
 
     def expand(self, query: str, num_expansions: int = 3) -> List[str]:
         """
@@ -25,13 +47,17 @@ class QueryExpansion:
             print("Warning: LLM model not available for query expansion. Skipping.")
             return [query]
 
-        prompt = f"""You are an expert in information retrieval. Your task is to expand a user's query to improve search results.
-Generate {num_expansions} alternative queries that are semantically related to the original query.
-The queries should be diverse and cover different aspects or phrasings of the original topic.
-Return ONLY a numbered list of the new queries. Do not include the original query.
+        if len(query.split()) < self.min_words:
+            return [query]
 
-Original Query: "{query}"
-"""
+        key = (query.strip().lower(), num_expansions)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return list(dict.fromkeys([query] + cached))
+
+        prompt = _PROMPT_TEMPLATE.format(n=num_expansions, q=query)
 
         messages = [
             {"role": "system", "content": "You are a helpful assistant that generates alternative search queries."},
@@ -42,12 +68,19 @@ Original Query: "{query}"
             response = self.llm_model.generate(
                 messages=messages,
                 temperature=0.5,
-                max_tokens=200
+                max_tokens=200,
+                use_cache=False  # Expansions have their own exact-match cache
             )
             content = response["choices"][0]["message"]["content"]
 
             # Parse the numbered list of queries
-            expanded_queries = [q.strip().split('. ', 1)[-1] for q in content.strip().split('\n') if '. ' in q]
+            expanded_queries = [q.strip() for q in _LIST_ITEM_RE.findall(content)][:num_expansions]
+
+            with self._lock:
+                self._cache[key] = expanded_queries
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
 
             # Combine and deduplicate
             all_queries = [query] + expanded_queries
@@ -1,23 +1,79 @@
 """
 Reranker Module using a Cross-Encoder model.
 """
-from typing import List, Dict, Any
+import os
+from typing import List, Dict, Any, Optional
+
+import numpy as np
 
 class Reranker:
     """
     Reranks documents based on relevance to a query using a Cross-Encoder.
+
+    With `url` set, pairs are scored by a remote Infinity/Cohere-style
+    `/rerank` server instead of a local model. Otherwise, on CPU, the
+    `backend="onnx"` default runs an INT8-quantized ONNX export of the model
+    through ONNX Runtime, falling back to the PyTorch Cross-Encoder.
     """
-    def __init__(self, model_name: str = 'cross-encoder/ms-marco-MiniLM-L-6-v2'):
+    def __init__(
+        self,
+        model_name: str = 'cross-encoder/ms-marco-MiniLM-L-6-v2',
+        batch_size: int = 32,
+        url: Optional[str] = None,
+        timeout: float = 30.0,
+        backend: str = "onnx",
+        onnx_dir: str = "./data/onnx"
+    ):
         self.model = None
+        self.client = None
+        self.session = None
+        self.tokenizer = None
+        self.backend = backend
+        self.onnx_dir = onnx_dir
         self.model_name = model_name
+        self.batch_size = batch_size
+        self.url = url
+        self.timeout = timeout
+        self.max_chars = None
         self._loaded = False
 
     def initialize(self):
-        """Load the Cross-Encoder model."""
+        """Load the Cross-Encoder model, in half precision when a GPU is available."""
+        if self.url:
+            import httpx
+            print(f"Using remote reranker: {self.url}")
+            self.client = httpx.Client(
+                base_url=self.url,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=64)
+            )
+            self._loaded = True
+            return
+
         try:
+            import torch
             from sentence_transformers import CrossEncoder
+
+            # On GPU the half-precision PyTorch model is faster than INT8 on CPU
+            if self.backend == "onnx" and not torch.cuda.is_available():
+                try:
+                    self._init_onnx()
+                    return
+                except Exception as e:
+                    print(f"Warning: Could not load ONNX reranker model: {e}")
+                    print("Falling back to the PyTorch Cross-Encoder")
+
             print(f"Loading reranker model: {self.model_name}")
-            self.model = CrossEncoder(self.model_name)
+            automodel_args = {}
+            if torch.cuda.is_available():
+                # Not bfloat16: CrossEncoder.predict converts scores with .numpy(), which rejects it
+                automodel_args["torch_dtype"] = torch.float16
+            self.model = CrossEncoder(self.model_name, automodel_args=automodel_args)
+
+            # A token is rarely longer than 8 characters, so this cut never drops text
+            # the model would have seen; it only spares tokenizing very long documents
+            max_length = self.model.max_length or self.model.tokenizer.model_max_length
+            self.max_chars = max_length * 8
             self._loaded = True
             print("Reranker model loaded.")
         except Exception as e:
@@ -25,6 +81,40 @@ class Reranker:
             print("Reranker will be disabled.")
             self._loaded = False
 
+    def _init_onnx(self):
+        """Export the Cross-Encoder to ONNX once, quantize to INT8 and open an ORT session."""
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        onnx_path = os.path.join(self.onnx_dir, f"{self.model_name.replace('/', '_')}-int8.onnx")
+        if not os.path.exists(onnx_path):
+            from transformers import AutoModelForSequenceClassification
+            from models.onnx_export import export_int8_onnx
+
+            print(f"Exporting {self.model_name} to ONNX...")
+            dummy = self.tokenizer(["query"], ["export"], return_tensors="pt")
+            export_int8_onnx(
+                AutoModelForSequenceClassification.from_pretrained(self.model_name),
+                dummy,
+                # forward() order; BERT-style models also take token_type_ids
+                input_names=[name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy],
+                output_name="logits",
+                output_axes={0: "batch"},
+                onnx_path=onnx_path
+            )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        print(f"Loading ONNX reranker model: {onnx_path}")
+        self.session = ort.InferenceSession(onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self._input_names = [i.name for i in self.session.get_inputs()]
+
+        self.max_length = min(self.tokenizer.model_max_length, 512)
+        self.max_chars = self.max_length * 8
+        self._loaded = True
+        print("ONNX reranker model loaded.")
+
     def is_loaded(self) -> bool:
         return self._loaded
 
@@ -45,17 +135,80 @@ class Reranker:
             # Return original top_k if reranker is not available or no docs
             return documents[:top_k]
 
-        # Create pairs of [query, document_content]
-        pairs = [[query, doc['content']] for doc in documents]
+        # Score each distinct content once; callers often pass overlapping sets
+        contents = list(dict.fromkeys(doc['content'] for doc in documents))
+
+        # Create pairs of [query, content], longest first so each batch
+        # holds similar lengths and pads less
+        contents.sort(key=len, reverse=True)
+        pairs = [[query, content[:self.max_chars]] for content in contents]
 
         # Predict scores
-        scores = self.model.predict(pairs, show_progress_bar=False)
+        scores = dict(zip(contents, self.predict(pairs)))
 
-        # Add scores to documents
-        for doc, score in zip(documents, scores):
-            doc['rerank_score'] = float(score)
+        # Add scores to every document, duplicates included
+        for doc in documents:
+            doc['rerank_score'] = float(scores[doc['content']])
 
         # Sort documents by the new rerank_score in descending order
         reranked_docs = sorted(documents, key=lambda x: x['rerank_score'], reverse=True)
 
         return reranked_docs[:top_k]
+
+    def predict(self, pairs: List[List[str]], batch_size: Optional[int] = None) -> np.ndarray:
+        """
+        Score [query, text] pairs with the cross-encoder.
+
+        Args:
+            pairs: The pairs to score.
+            batch_size: Pairs per forward pass (defaults to the reranker's batch size).
+
+        Returns:
+            One relevance score per pair.
+        """
+        if self.client is not None:
+            return self._predict_remote(pairs)
+        if self.session is not None:
+            batch_size = batch_size or self.batch_size
+            return np.concatenate([
+                self._predict_onnx(pairs[i:i + batch_size])
+                for i in range(0, len(pairs), batch_size)
+            ]) if pairs else np.empty(0, dtype=np.float32)
+        return np.asarray(self.model.predict(
+            pairs, batch_size=batch_size or self.batch_size, show_progress_bar=False
+        ))
+
+    def _predict_onnx(self, pairs: List[List[str]]) -> np.ndarray:
+        """Score one batch with the ONNX session, matching CrossEncoder.predict's output."""
+        tokens = self.tokenizer(
+            [query for query, _ in pairs],
+            [text for _, text in pairs],
+            padding="longest",
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="np"
+        )
+        logits = self.session.run(["logits"], {name: tokens[name].astype(np.int64) for name in self._input_names})[0]
+        if logits.shape[1] == 1:
+            # CrossEncoder applies a sigmoid to single-label models
+            return 1 / (1 + np.exp(-logits[:, 0]))
+        return logits[:, -1]
+
+    def _predict_remote(self, pairs: List[List[str]]) -> np.ndarray:
+        """One /rerank request per distinct query; the server batches them internally."""
+        by_query: Dict[str, List[int]] = {}
+        for i, (query, _) in enumerate(pairs):
+            by_query.setdefault(query, []).append(i)
+
+        scores = np.empty(len(pairs), dtype=np.float32)
+        for query, positions in by_query.items():
+            response = self.client.post("/rerank", json={
+                "model": self.model_name,
+                "query": query,
+                "documents": [pairs[i][1] for i in positions],
+                "return_documents": False
+            })
+            response.raise_for_status()
+            for result in response.json()["results"]:
+                scores[positions[result["index"]]] = result["relevance_score"]
+        return scores
@@ -1,37 +1,162 @@
 """
-Simple in-memory vector store using FAISS
+Simple in-memory vector store using NumPy, with FAISS HNSW for large corpora
 """
 
+import threading
+from contextlib import contextmanager
+
 import numpy as np
-from typing import List, Dict, Any, Optional, Tuple
+import orjson
+from typing import Callable, List, Dict, Any, Optional, Tuple
 import os
 
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+# Rows dequantized per block when searching int8 storage
+_DEQUANT_BLOCK = 65_536
+
+
+class _ReadWriteLock:
+    """
+    Shared lock for searches, exclusive and re-entrant lock for writers.
+    
+    A waiting writer holds off new readers, so a steady stream of searches
+    cannot starve indexing.
+    """
+    
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer: Optional[int] = None
+        self._depth = 0
+        self._waiting_writers = 0
+    
+    @contextmanager
+    def read(self):
+        with self._cond:
+            if self._writer == threading.get_ident():
+                # The writing thread already has exclusive access
+                owned = True
+            else:
+                owned = False
+                while self._writer is not None or self._waiting_writers:
+                    self._cond.wait()
+                self._readers += 1
+        try:
+            yield
+        finally:
+            if not owned:
+                with self._cond:
+                    self._readers -= 1
+                    if not self._readers:
+                        self._cond.notify_all()
+    
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer != me:
+                self._waiting_writers += 1
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+                self._waiting_writers -= 1
+                self._writer = me
+            self._depth += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._depth -= 1
+                if not self._depth:
+                    self._writer = None
+                    self._cond.notify_all()
+
 
 class VectorStore:
-    """In-memory vector store with FAISS-like functionality"""
+    """
+    In-memory vector store over a contiguous float32 embedding matrix.
+    
+    Embeddings are L2-normalized on insert, so inner product equals cosine
+    similarity. `index_type` selects the search backend:
+    
+    - "flat": exact NumPy matmul over the matrix
+    - "faiss": exact FAISS IndexFlatIP (SIMD kernels), deletions remove ids
+    - "hnsw": approximate FAISS HNSW graph from the first insert, built with
+      `hnsw_m` links per node and searched with an `ef_search` candidate list
+    - "ivfpq": "flat" until the store grows past `ivf_threshold`, then a FAISS
+      IVF-PQ index trained on the stored vectors; searches visit `nprobe` of
+      its cells and score 8-bit product-quantized codes
+    - "auto": "flat" until the store grows past `hnsw_threshold`, then "hnsw"
+    
+    The FAISS backends fall back to "flat" when faiss is not installed.
+    
+    With `storage="int8"` rows are kept symmetrically quantized with one scale
+    per row, a quarter of the float32 footprint; flat search dequantizes the
+    matrix block by block and rescales the scores.
+    """
     
-    def __init__(self, dimension: int = 384):
+    def __init__(
+        self,
+        dimension: int = 384,
+        hnsw_threshold: int = 100_000,
+        hnsw_m: int = 32,
+        ef_construction: int = 200,
+        ef_search: int = 64,
+        initial_capacity: int = 1024,
+        index_type: str = "auto",
+        storage: str = "float32",
+        ivf_threshold: int = 100_000,
+        nprobe: int = 16
+    ):
         self.dimension = dimension
-        self.vectors: List[np.ndarray] = []
-        self.documents: List[Dict[str, Any]] = []
-        self.index = None
+        self.hnsw_threshold = hnsw_threshold
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.initial_capacity = initial_capacity
+        if index_type not in ("auto", "flat") and faiss is None:
+            print(f"Warning: faiss not installed, using flat search instead of {index_type}")
+            index_type = "flat"
+        self.configured_index_type = index_type
+        self.storage = storage
+        # Writers (which also get disjoint id ranges) exclude searches: FAISS indexes
+        # are not safe to search while being added to, and ids must not be
+        # visible before their documents are
+        self._lock = _ReadWriteLock()
+        self.clear()
         
     def add(self, embedding: np.ndarray, document: Dict[str, Any]) -> int:
         """Add a single embedding and document"""
-        doc_id = len(self.vectors)
-        self.vectors.append(embedding)
-        self.documents.append({
-            "id": doc_id,
-            **document
-        })
+        vector = self._prepare(embedding)
+        with self._lock.write():
+            doc_id = len(self.documents)
+            self._append(vector)
+            self.documents.append({
+                "id": doc_id,
+                **document
+            })
+            self._maybe_upgrade()
         return doc_id
     
     def add_batch(self, embeddings: np.ndarray, documents: List[Dict[str, Any]]) -> List[int]:
         """Add multiple embeddings and documents"""
-        ids = []
-        for emb, doc in zip(embeddings, documents):
-            ids.append(self.add(emb, doc))
-        return ids
+        if not documents:
+            return []
+        vectors = self._prepare(embeddings)
+        with self._lock.write():
+            start = len(self.documents)
+            self._append(vectors)
+            self.documents.extend(
+                {"id": doc_id, **doc}
+                for doc_id, doc in enumerate(documents, start)
+            )
+            self._maybe_upgrade()
+        return list(range(start, start + len(documents)))
     
     def search(self, query_embedding: np.ndarray, top_k: int = 5) -> List[Tuple[int, float, Dict[str, Any]]]:
         """
@@ -40,54 +165,308 @@ class VectorStore:
         Returns:
             List of (doc_id, similarity_score, document)
         """
-        if not self.vectors:
-            return []
+        return self.search_batch(query_embedding, top_k)[0]
+    
+    def search_batch(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int = 5,
+        nprobe: Optional[int] = None
+    ) -> List[List[Tuple[int, float, Dict[str, Any]]]]:
+        """
+        Search for several queries at once
         
-        # Normalize query
-        query_norm = query_embedding / np.linalg.norm(query_embedding)
+        Args:
+            nprobe: IVF cells to visit per query with the "ivfpq" index
+                (defaults to `self.nprobe`); ignored by the other backends
         
-        # Calculate cosine similarities
-        similarities = []
-        for i, vec in enumerate(self.vectors):
-            vec_norm = vec / np.linalg.norm(vec)
-            sim = float(np.dot(query_norm, vec_norm))
-            similarities.append((i, sim, self.documents[i]))
+        Returns:
+            One list of (doc_id, similarity_score, document) per query row
+        """
+        queries = self._prepare(query_embeddings)
+        with self._lock.read():
+            if self.count() == 0:
+                return [[] for _ in range(len(queries))]
         
-        # Sort by similarity
-        similarities.sort(key=lambda x: x[1], reverse=True)
+            if self.index_type == "hnsw":
+                # HNSW keeps deleted vectors, so over-fetch to leave room for them
+                k = min(top_k + self._deleted, self._n)
+                # The candidate list must hold at least k entries for k results
+                params = faiss.SearchParametersHNSW(efSearch=max(self.ef_search, k))
+                scores, ids = self.index.search(queries, k, params=params)
+            elif self.index_type == "ivfpq":
+                # Per-call parameters, so concurrent searches can use different nprobe
+                params = faiss.SearchParametersIVF(nprobe=nprobe or self.nprobe)
+                scores, ids = self.index.search(queries, min(top_k, self.count()), params=params)
+            elif self.index is not None:
+                scores, ids = self.index.search(queries, min(top_k, self.count()))
+            else:
+                # Exact search: one (Q, D) @ (D, N) matmul with deleted rows masked
+                # out, then select and sort only the top k of each row
+                k = min(top_k, self.count())
+                similarities = self._similarities(queries)
+                if self._deleted:
+                    similarities[:, ~self._active[:self._n]] = -np.inf
+                if k < self._n:
+                    ids = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+                else:
+                    ids = np.broadcast_to(np.arange(self._n), similarities.shape)
+                scores = np.take_along_axis(similarities, ids, axis=1)
+                order = np.argsort(-scores, axis=1, kind="stable")
+                ids = np.take_along_axis(ids, order, axis=1)
+                scores = np.take_along_axis(scores, order, axis=1)
         
-        return similarities[:top_k]
+            # Convert the (Q, k) arrays to Python scalars in bulk rather than per element
+            batch_results = []
+            for row_ids, row_scores in zip(ids.tolist(), scores.tolist()):
+                results = []
+                for doc_id, score in zip(row_ids, row_scores):
+                    if doc_id < 0 or not self._active[doc_id]:
+                        continue
+                    results.append((doc_id, score, self.documents[doc_id]))
+                    if len(results) == top_k:
+                        break
+                batch_results.append(results)
+            return batch_results
     
     def delete(self, doc_id: int) -> bool:
         """Delete a document by ID"""
-        if 0 <= doc_id < len(self.documents):
-            # Mark as deleted (keep indices stable)
-            self.documents[doc_id] = None
-            self.vectors[doc_id] = np.zeros(self.dimension)
-            return True
-        return False
+        with self._lock.write():
+            if 0 <= doc_id < len(self.documents) and self._active[doc_id]:
+                # Clear the bit (keep indices stable); search masks the row out
+                self._active[doc_id] = False
+                self.documents[doc_id] = None
+                self._deleted += 1
+                if self.index_type in ("faiss", "ivfpq"):
+                    self.index.remove_ids(np.array([doc_id], dtype=np.int64))
+                return True
+            return False
+    
+    def compact(
+        self,
+        min_dead_fraction: float = 0.25,
+        on_compacted: Optional[Callable[[], None]] = None
+    ) -> Optional[np.ndarray]:
+        """
+        Drop deleted rows once they make up at least `min_dead_fraction` of the store
+        
+        `on_compacted` runs while searches are still held off, so indexes keyed
+        by doc id can be renumbered before anyone sees the new ids.
+        
+        Returns:
+            Array mapping each old doc id to its new id (-1 if deleted), or None
+            if nothing was compacted
+        """
+        with self._lock.write():
+            if self._deleted == 0 or self._deleted < min_dead_fraction * self._n:
+                return None
+        
+            active = self._active[:self._n]
+            mapping = np.full(self._n, -1, dtype=np.int64)
+            mapping[active] = np.arange(self._n - self._deleted)
+            vectors = self._vectors()[active]
+            documents = [doc for doc in self.documents if doc is not None]
+        
+            self.clear()
+            self._append(vectors)
+            self.documents = [{**doc, "id": doc_id} for doc_id, doc in enumerate(documents)]
+            self._maybe_upgrade()
+            if on_compacted is not None:
+                on_compacted()
+            return mapping
     
     def clear(self):
         """Clear all data"""
-        self.vectors = []
-        self.documents = []
+        with self._lock.write():
+            self.documents: List[Optional[Dict[str, Any]]] = []
+            dtype = np.int8 if self.storage == "int8" else np.float32
+            self._matrix = np.empty((self.initial_capacity, self.dimension), dtype=dtype)
+            self._scales = np.ones(self.initial_capacity, dtype=np.float32)
+            self._active = np.zeros(self.initial_capacity, dtype=bool)
+            self._n = 0
+            self._deleted = 0
+            self.index = None
+            self.index_type = "flat"
+            if self.configured_index_type == "faiss":
+                # Map ids explicitly so deleted documents can be removed from the index
+                self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dimension))
+                self.index_type = "faiss"
+            elif self.configured_index_type == "hnsw":
+                self.index = self._new_hnsw()
+                self.index_type = "hnsw"
         
     def count(self) -> int:
         """Get number of documents"""
-        return len([d for d in self.documents if d is not None])
+        return len(self.documents) - self._deleted
     
     def save(self, path: str):
-        """Save to disk"""
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        np.savez(
-            path,
-            vectors=np.array(self.vectors),
-            documents=np.array(self.documents, dtype=object)
-        )
+        """
+        Save to disk: the stored matrix as .npy, documents as JSON lines, and
+        the HNSW graph (if built) so loading does not have to rebuild it
+        """
+        with self._lock.read():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            np.save(f"{path}.npy", self._matrix[:self._n])
+            if self.storage == "int8":
+                np.save(f"{path}.scales.npy", self._scales[:self._n])
+            hnsw_path = f"{path}.hnsw"
+            if self.index_type == "hnsw":
+                faiss.write_index(self.index, hnsw_path)
+            elif os.path.exists(hnsw_path):
+                os.remove(hnsw_path)
+            with open(f"{path}.jsonl", "wb") as f:
+                for doc in self.documents:
+                    f.write(orjson.dumps(doc) + b"\n")
     
     def load(self, path: str):
-        """Load from disk"""
-        if os.path.exists(path):
-            data = np.load(path, allow_pickle=True)
-            self.vectors = list(data['vectors'])
-            self.documents = list(data['documents'])
+        """
+        Load from disk
+        
+        The matrix is memory-mapped read-only, so pages are read on demand; the
+        first add after loading copies it into a writable array.
+        """
+        if not os.path.exists(f"{path}.npy"):
+            return
+        
+        with self._lock.write():
+            matrix = np.load(f"{path}.npy", mmap_mode="r")
+            scales_path = f"{path}.scales.npy"
+            scales = np.load(scales_path) if os.path.exists(scales_path) else None
+        
+            self.clear()
+            if matrix.dtype == self._matrix.dtype:
+                self._matrix = matrix
+                # Every per-row array must match the matrix, or the next _grow fails
+                self._scales = scales if scales is not None else np.ones(len(matrix), dtype=np.float32)
+                self._n = len(matrix)
+                self._active = np.ones(self._n, dtype=bool)
+                # A saved HNSW graph already holds every row; other indexes are rebuilt
+                if not self._load_hnsw(f"{path}.hnsw"):
+                    if self.index_type == "faiss":
+                        self.index.add_with_ids(self._vectors(), np.arange(self._n, dtype=np.int64))
+                    elif self.index is not None:
+                        self.index.add(self._vectors())
+            else:
+                # Saved with the other storage type; convert through the normal insert path
+                vectors = np.asarray(matrix, dtype=np.float32)
+                if scales is not None:
+                    vectors *= scales[:, None]
+                self._append(vectors)
+        
+            with open(f"{path}.jsonl", "rb") as f:
+                self.documents = [orjson.loads(line) for line in f]
+            deleted = [i for i, d in enumerate(self.documents) if d is None]
+            self._deleted = len(deleted)
+            self._active[deleted] = False
+            if deleted and self.index_type == "faiss":
+                self.index.remove_ids(np.array(deleted, dtype=np.int64))
+            self._maybe_upgrade()
+
+    def _prepare(self, embeddings: np.ndarray) -> np.ndarray:
+        """Copy to a contiguous float32 (n, dimension) matrix and L2-normalize rows"""
+        vectors = np.array(embeddings, dtype=np.float32, ndmin=2)
+        vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors
+    
+    def _grow(self, array: np.ndarray, capacity: int) -> np.ndarray:
+        """Copy the live rows of `array` into a zeroed array with `capacity` rows"""
+        grown = np.zeros((capacity, *array.shape[1:]), dtype=array.dtype)
+        grown[:self._n] = array[:self._n]
+        return grown
+    
+    def _vectors(self) -> np.ndarray:
+        """Live rows as float32, dequantizing int8 storage"""
+        if self.storage == "int8":
+            return self._matrix[:self._n].astype(np.float32) * self._scales[:self._n, None]
+        return self._matrix[:self._n]
+    
+    def _similarities(self, queries: np.ndarray) -> np.ndarray:
+        """(Q, N) cosine similarities of normalized queries against every stored row"""
+        if self.storage != "int8":
+            return queries @ self._matrix[:self._n].T
+        
+        # Dequantize a block at a time so the float32 copy never exceeds one block
+        similarities = np.empty((len(queries), self._n), dtype=np.float32)
+        for start in range(0, self._n, _DEQUANT_BLOCK):
+            stop = min(start + _DEQUANT_BLOCK, self._n)
+            similarities[:, start:stop] = queries @ self._matrix[start:stop].astype(np.float32).T
+        similarities *= self._scales[:self._n]
+        return similarities
+    
+    def _append(self, vectors: np.ndarray):
+        """Copy normalized rows into the matrix, growing it geometrically when full"""
+        needed = self._n + len(vectors)
+        if needed > len(self._matrix):
+            capacity = max(needed, 2 * len(self._matrix))
+            self._matrix = self._grow(self._matrix, capacity)
+            self._scales = self._grow(self._scales, capacity)
+            self._active = self._grow(self._active, capacity)
+        if self.storage == "int8":
+            scales = np.clip(np.abs(vectors).max(axis=1), 1e-12, None) / 127
+            self._matrix[self._n:needed] = np.round(vectors / scales[:, None])
+            self._scales[self._n:needed] = scales
+        else:
+            self._matrix[self._n:needed] = vectors
+        self._active[self._n:needed] = True
+        if self.index_type in ("faiss", "ivfpq"):
+            self.index.add_with_ids(vectors, np.arange(self._n, needed, dtype=np.int64))
+        elif self.index is not None:
+            self.index.add(vectors)
+        self._n = needed
+    
+    def _maybe_upgrade(self):
+        """Build an ANN index over the matrix once it outgrows brute-force search"""
+        if self.index is not None or faiss is None:
+            return
+        if self.configured_index_type == "ivfpq" and self._n > self.ivf_threshold:
+            self._build_ivfpq()
+        elif self.configured_index_type == "auto" and self._n > self.hnsw_threshold:
+            index = self._new_hnsw()
+            index.add(self._vectors())
+            self.index = index
+            self.index_type = "hnsw"
+    
+    def _build_ivfpq(self):
+        """Train an IVF-PQ index on a sample of the stored vectors and add them all"""
+        nlist = int(4 * np.sqrt(self._n))
+        # One 8-bit code per 8 dimensions; PQ needs the sub-quantizers to divide the dimension
+        m = max(self.dimension // 8, 1)
+        while self.dimension % m:
+            m -= 1
+        quantizer = faiss.IndexFlatIP(self.dimension)
+        index = faiss.IndexIVFPQ(quantizer, self.dimension, nlist, m, 8, faiss.METRIC_INNER_PRODUCT)
+        
+        vectors = np.ascontiguousarray(self._vectors(), dtype=np.float32)
+        sample_size = min(self._n, max(64 * nlist, 65_536))
+        sample = np.random.default_rng(0).choice(self._n, sample_size, replace=False)
+        print(f"Training IVF-PQ index (nlist={nlist}, m={m}) on {sample_size} vectors...")
+        index.train(vectors[np.sort(sample)])
+        index.add_with_ids(vectors, np.arange(self._n, dtype=np.int64))
+        inactive = np.flatnonzero(~self._active[:self._n])
+        if len(inactive):
+            index.remove_ids(inactive.astype(np.int64))
+        
+        self.index = index
+        self.index_type = "ivfpq"
+    
+    def _load_hnsw(self, hnsw_path: str) -> bool:
+        """Adopt a saved HNSW graph if this store would use HNSW for its rows"""
+        if faiss is None or not os.path.exists(hnsw_path):
+            return False
+        wants_hnsw = self.configured_index_type == "hnsw" or (
+            self.configured_index_type == "auto" and self._n > self.hnsw_threshold
+        )
+        if not wants_hnsw:
+            return False
+        index = faiss.read_index(hnsw_path)
+        if index.ntotal != self._n or index.d != self.dimension:
+            return False
+        self.index = index
+        self.index_type = "hnsw"
+        return True
+    
+    def _new_hnsw(self):
+        """Empty HNSW graph; it has no remove_ids, so deletions stay tombstones"""
+        index = faiss.IndexHNSWFlat(self.dimension, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = self.ef_construction
+        return index
@@ -4,12 +4,14 @@ Chat completion router - OpenAI-compatible endpoint
 
 import time
 import uuid
-from typing import List, Optional, Dict, Any
+from typing import AsyncIterator, List, Optional, Dict, Any
 
+import orjson
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
 
 class Message(BaseModel):
@@ -77,9 +79,23 @@ async def chat_completion(request: ChatRequest):
     # Convert messages to dict format
     messages = [{"role": m.role, "content": m.content} for m in request.messages]
     
+    if request.stream:
+        return StreamingResponse(
+            _stream_chunks(
+                llm_model.astream(
+                    messages=messages,
+                    temperature=request.temperature,
+                    max_tokens=request.max_tokens or 1024,
+                    top_p=request.top_p,
+                    stop=request.stop
+                )
+            ),
+            media_type="text/event-stream"
+        )
+    
     try:
-        # Generate response
-        result = llm_model.generate(
+        # Generate response off the event loop
+        result = await llm_model.agenerate(
             messages=messages,
             temperature=request.temperature,
             max_tokens=request.max_tokens or 1024,
@@ -87,33 +103,48 @@ async def chat_completion(request: ChatRequest):
             stop=request.stop
         )
         
-        # Convert to response model
-        return ChatResponse(
-            id=result["id"],
-            created=result["created"],
-            model=result["model"],
-            choices=[
-                ChatChoice(
-                    index=c["index"],
-                    message=Message(
-                        role=c["message"]["role"],
-                        content=c["message"]["content"]
-                    ),
-                    finish_reason=c["finish_reason"]
-                )
+        # Project to the ChatResponse shape and let orjson serialize it directly,
+        # skipping the model construction and response-model re-validation
+        return ORJSONResponse(content={
+            "id": result["id"],
+            "object": "chat.completion",
+            "created": result["created"],
+            "model": result["model"],
+            "choices": [
+                {
+                    "index": c["index"],
+                    "message": {
+                        "role": c["message"]["role"],
+                        "content": c["message"]["content"],
+                        "name": None,
+                        "function_call": None
+                    },
+                    "finish_reason": c["finish_reason"]
+                }
                 for c in result["choices"]
             ],
-            usage=Usage(
-                prompt_tokens=result["usage"]["prompt_tokens"],
-                completion_tokens=result["usage"]["completion_tokens"],
-                total_tokens=result["usage"]["total_tokens"]
-            )
-        )
+            "usage": {
+                "prompt_tokens": result["usage"]["prompt_tokens"],
+                "completion_tokens": result["usage"]["completion_tokens"],
+                "total_tokens": result["usage"]["total_tokens"]
+            }
+        })
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _stream_chunks(chunks: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    """Frame completion chunks as Server-Sent Events, ending with [DONE]"""
+    try:
+        async for chunk in chunks:
+            yield b"data: " + orjson.dumps(chunk) + b"\n\n"
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band
+        yield b"data: " + orjson.dumps({"error": {"message": str(e)}}) + b"\n\n"
+    yield b"data: [DONE]\n\n"
+
+
 @router.get("/models")
 async def list_models():
     """List available models"""
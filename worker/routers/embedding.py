@@ -8,11 +8,12 @@ import logging
 from typing import List, Union, Optional, Dict, Any
 
 from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
 
 class EmbeddingRequest(BaseModel):
@@ -50,7 +51,7 @@ async def create_embedding(request: EmbeddingRequest):
     """
     Generate embeddings for text (OpenAI-compatible)
     """
-    from models import embedding_model
+    from models import embedding_model, async_embedder
     
     if not embedding_model.is_loaded():
         raise HTTPException(status_code=503, detail="Embedding model not loaded")
@@ -59,27 +60,30 @@ async def create_embedding(request: EmbeddingRequest):
     texts = request.input if isinstance(request.input, list) else [request.input]
     
     try:
-        # Generate embeddings
-        embeddings = embedding_model.encode(texts)
+        # Generate embeddings (batched with concurrent requests)
+        embeddings = await async_embedder.encode(texts)
         
         # Calculate token count (rough estimate)
         total_tokens = sum(len(text.split()) for text in texts)
         
-        # Build response
-        return EmbeddingResponse(
-            data=[
-                EmbeddingData(
-                    embedding=emb.tolist(),
-                    index=i
-                )
+        # Build response; orjson serializes the NumPy rows directly, so skip
+        # the .tolist() copy and the pydantic re-validation of every float
+        return ORJSONResponse(content={
+            "object": "list",
+            "data": [
+                {
+                    "object": "embedding",
+                    "embedding": emb,
+                    "index": i
+                }
                 for i, emb in enumerate(embeddings)
             ],
-            model=embedding_model.model_name,
-            usage=EmbeddingUsage(
-                prompt_tokens=total_tokens,
-                total_tokens=total_tokens
-            )
-        )
+            "model": embedding_model.model_name,
+            "usage": {
+                "prompt_tokens": total_tokens,
+                "total_tokens": total_tokens
+            }
+        })
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -90,20 +94,20 @@ async def compute_similarity(text1: str, text2: str):
     """
     Compute cosine similarity between two texts
     """
-    from models import embedding_model
+    from models import embedding_model, async_embedder
     
     if not embedding_model.is_loaded():
         raise HTTPException(status_code=503, detail="Embedding model not loaded")
     
     try:
-        embeddings = embedding_model.encode([text1, text2])
+        embeddings = await async_embedder.encode([text1, text2])
         similarity = embedding_model.similarity(embeddings[0], embeddings[1])
         
-        return {
+        return ORJSONResponse(content={
             "similarity": similarity,
             "text1": text1[:100],
             "text2": text2[:100]
-        }
+        })
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -2,23 +2,102 @@
 RAG (Retrieval Augmented Generation) router using the RAGPipeline
 """
 
-from typing import List, Optional, Dict, Any
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel, Field
+import asyncio
+import functools
+import time
+import uuid
+from typing import Callable, List, Optional, Dict, Any
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError, field_validator, model_validator
 
+from models.config import get_settings
+from routers.chat import _stream_chunks
+
+# Add a 'pipeline' attribute to the router instance to hold the pipeline object.
 # This is a placeholder and will be replaced by the instance from app.py
 # during the application lifespan startup.
-pipeline = None
+router = APIRouter(default_response_class=ORJSONResponse)
+router.pipeline = None
+# Dedicated thread pool for the module endpoints, also set at startup
+router.executor = None
+# Micro-batcher coalescing concurrent retrievals, also set at startup
+router.retrieval_batcher = None
+
+# Background /rag/index jobs by job id, polled through /rag/index/status/{job_id}
+INDEX_JOBS: Dict[str, Dict[str, Any]] = {}
+MAX_INDEX_JOBS = 1000
+# Strong references so running jobs are not garbage collected
+_index_tasks = set()
 
 def get_pipeline():
     """Dependency to get the initialized RAG pipeline."""
-    if pipeline is None:
+    if router.pipeline is None:
         raise HTTPException(status_code=503, detail="RAG pipeline is not available.")
-    return pipeline
+    return router.pipeline
 
-# Add a 'pipeline' attribute to the router instance to hold the pipeline object
-router = APIRouter()
-router.pipeline = None
+async def retrieve(
+    rag_pipeline,
+    query: str,
+    top_k: int,
+    metadata_filter: Optional[Dict[str, Any]] = None,
+    nprobe: Optional[int] = None,
+    candidates: Optional[int] = None,
+    alpha: Optional[float] = None
+):
+    """Retrieve through the micro-batcher when it is running, else on a worker thread."""
+    # A batch shares one search call, so a per-request nprobe goes on its own
+    if router.retrieval_batcher is not None and nprobe is None:
+        return await router.retrieval_batcher.retrieve(query, top_k, metadata_filter, candidates, alpha)
+    return await asyncio.to_thread(rag_pipeline.retrieve, query, top_k, metadata_filter, nprobe, candidates, alpha)
+
+async def run_in_executor(fn, *args):
+    """
+    Run a blocking call on the RAG thread pool (the loop's default pool if unset).
+
+    Threads rather than processes: the module endpoints spend their time in
+    ONNX Runtime, PyTorch or llama.cpp, which release the GIL, and the loaded
+    models cannot be shared with child processes. Scale across cores with
+    WORKER_WORKERS instead.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(router.executor, functools.partial(fn, *args))
+
+async def index_concurrently(
+    rag_pipeline,
+    documents: List[Dict[str, Any]],
+    chunk_size: int,
+    chunk_overlap: int,
+    on_batch: Optional[Callable[[int, int], None]] = None
+) -> int:
+    """
+    Index documents as concurrent mini-batches, returning the number of chunks indexed.
+
+    Documents are sorted by length first so each batch pads to similar sequence lengths.
+    `on_batch(documents, chunks)` is called as each batch finishes.
+    """
+    settings = get_settings()
+    documents = sorted(documents, key=lambda doc: len(doc["content"]))
+    batch_size = settings.rag_index_batch_size
+    semaphore = asyncio.Semaphore(settings.rag_index_max_in_flight)
+
+    async def index_batch(batch):
+        async with semaphore:
+            count = await asyncio.to_thread(
+                rag_pipeline.index_documents,
+                batch,
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap
+            )
+        if on_batch is not None:
+            on_batch(len(batch), count)
+        return count
+
+    counts = await asyncio.gather(*[
+        index_batch(documents[start:start + batch_size])
+        for start in range(0, len(documents), batch_size)
+    ])
+    return sum(counts)
 
 # --- Shared Models ---
 
@@ -29,21 +108,44 @@ class Document(BaseModel):
 
 class SearchResult(BaseModel):
     id: str
-    content: str
+    # Omitted by /rag/search when include_content is false
+    content: Optional[str] = None
     score: float
     metadata: Optional[Dict[str, Any]] = None
     rerank_score: Optional[float] = None
 
+    @field_validator("id", mode="before")
+    @classmethod
+    def _id_to_str(cls, value):
+        # Vector store ids are ints; the API exposes them as strings
+        return str(value)
+
 # --- Request Models ---
 
+# Larger ingests go through the NDJSON /rag/index/stream endpoint
+MAX_INDEX_DOCUMENTS = 10_000
+# Longest single document line the stream endpoint buffers
+MAX_STREAM_LINE_BYTES = 8 * 1024 * 1024
+
 class IndexRequest(BaseModel):
-    documents: List[Document]
+    documents: List[Document] = Field(max_length=MAX_INDEX_DOCUMENTS)
     chunk_size: int = Field(default=512, ge=100, le=2000)
     chunk_overlap: int = Field(default=50, ge=0, le=200)
+    async_mode: bool = Field(default=False, description="Return a job id immediately and index in the background.")
 
 class SearchRequest(BaseModel):
     query: str
     top_k: int = Field(default=5, ge=1, le=20)
+    filter: Optional[Dict[str, Any]] = Field(default=None, description="Only return chunks whose metadata has these key/value pairs.")
+    retrieval_candidates: Optional[int] = Field(default=None, ge=1, le=1000, description="Vector search hits passed to the reranker (default 5 * top_k); equal to top_k skips reranking.")
+    alpha: Optional[float] = Field(default=None, ge=0, le=1, description="Dense vs BM25 keyword weight for candidate ranking (1 = dense only; default WORKER_RAG_HYBRID_ALPHA).")
+    include_content: bool = Field(default=True, description="Return chunk content and metadata; false returns only id, score and rerank_score.")
+
+    @model_validator(mode="after")
+    def _enough_candidates(self):
+        if self.retrieval_candidates is not None and self.retrieval_candidates < self.top_k:
+            raise ValueError("retrieval_candidates must be at least top_k")
+        return self
 
 class RAGRequest(BaseModel):
     query: str
@@ -52,6 +154,7 @@ class RAGRequest(BaseModel):
     use_fact_checking: bool = Field(default=True, description="Whether to fact-check the generated answer.")
     temperature: float = Field(default=0.7, ge=0, le=2)
     max_tokens: int = Field(default=1024, ge=1, le=4096)
+    max_context_tokens: Optional[int] = Field(default=None, ge=1, description="Token budget for retrieved sources in the prompt.")
     system_prompt: Optional[str] = None
 
 class RAGResponse(BaseModel):
@@ -80,20 +183,69 @@ class FactCheckRequest(BaseModel):
     answer: str
     documents: List[Document]
 
+# Minimal valid payload per model, validated once at startup
+_WARMUP_DOCUMENTS = [{"id": "warmup", "content": "warmup", "metadata": {"source": "warmup"}}]
+_WARMUP_PAYLOADS = {
+    IndexRequest: {"documents": _WARMUP_DOCUMENTS},
+    SearchRequest: {"query": "warmup", "filter": {"source": "warmup"}},
+    RAGRequest: {"query": "warmup"},
+    ExpandQueryRequest: {"query": "warmup"},
+    RerankRequest: {"query": "warmup", "documents": _WARMUP_DOCUMENTS},
+    CompressRequest: {"query": "warmup", "documents": _WARMUP_DOCUMENTS},
+    FactCheckRequest: {"answer": "warmup", "documents": _WARMUP_DOCUMENTS},
+    RAGResponse: {"answer": "warmup", "model": "warmup", "sources": [{"id": 0, "content": "warmup", "score": 1.0}]},
+}
+
+def warm_up_models():
+    """Run every request/response model through validation and serialization once.
+
+    Pydantic builds the validators at import time, but the first call through
+    each one still pays for lazy setup; doing it here keeps that cost off the
+    first request of each type.
+    """
+    for model, payload in _WARMUP_PAYLOADS.items():
+        model.model_validate(payload).model_dump_json()
+
 # --- Endpoints ---
 
 @router.post("/rag/index")
-async def index_documents(request: IndexRequest, rag_pipeline = Depends(get_pipeline)):
+async def index_documents(
+    request: IndexRequest,
+    sync: bool = Query(default=False, description="Index in a single call instead of concurrent batches."),
+    rag_pipeline = Depends(get_pipeline)
+):
     """
     Index documents using the RAG pipeline.
     """
     try:
         docs_to_index = [{"content": doc.content, "metadata": doc.metadata or {}} for doc in request.documents]
-        indexed_count = rag_pipeline.index_documents(
-            docs_to_index,
-            chunk_size=request.chunk_size,
-            chunk_overlap=request.chunk_overlap
-        )
+        if request.async_mode:
+            job_id = uuid.uuid4().hex
+            _prune_index_jobs()
+            INDEX_JOBS[job_id] = {
+                "job_id": job_id,
+                "status": "queued",
+                "progress": 0.0,
+                "indexed_documents": 0,
+                "indexed_chunks": 0,
+                "total_documents": len(docs_to_index),
+                "created_at": time.time()
+            }
+            task = asyncio.create_task(_run_index(job_id, rag_pipeline, docs_to_index, request))
+            _index_tasks.add(task)
+            task.add_done_callback(_index_tasks.discard)
+            return {"status": "queued", "job_id": job_id}
+        if sync:
+            indexed_count = await asyncio.to_thread(
+                rag_pipeline.index_documents,
+                docs_to_index,
+                chunk_size=request.chunk_size,
+                chunk_overlap=request.chunk_overlap
+            )
+        else:
+            indexed_count = await index_concurrently(
+                rag_pipeline, docs_to_index, request.chunk_size, request.chunk_overlap
+            )
         return {
             "status": "success",
             "indexed_chunks": indexed_count,
@@ -102,14 +254,160 @@ async def index_documents(request: IndexRequest, rag_pipeline = Depends(get_pipe
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to index documents: {e}")
 
+@router.post("/rag/index/stream")
+async def index_stream(
+    request: Request,
+    chunk_size: int = Query(default=512, ge=100, le=2000),
+    chunk_overlap: int = Query(default=50, ge=0, le=200),
+    rag_pipeline = Depends(get_pipeline)
+):
+    """
+    Index newline-delimited JSON documents (one Document per line) as they arrive.
+
+    Documents are validated line by line and indexed in batches while the body
+    is still being read; at most WORKER_RAG_INDEX_MAX_IN_FLIGHT batches run at
+    once, and reading pauses until one finishes. A line longer than
+    MAX_STREAM_LINE_BYTES is rejected with 413 without buffering the rest.
+    """
+    settings = get_settings()
+    semaphore = asyncio.Semaphore(settings.rag_index_max_in_flight)
+    tasks = []
+    batch = []
+    total = 0
+
+    async def index_batch(docs):
+        try:
+            return await asyncio.to_thread(
+                rag_pipeline.index_documents,
+                docs,
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap
+            )
+        finally:
+            semaphore.release()
+
+    async def flush():
+        nonlocal batch
+        docs, batch = batch, []
+        docs.sort(key=lambda doc: len(doc["content"]))
+        # Stop reading the body while max_in_flight batches are running
+        await semaphore.acquire()
+        tasks.append(asyncio.create_task(index_batch(docs)))
+
+    async def add_line(line: bytes, line_number: int):
+        nonlocal total
+        if not line.strip():
+            return
+        try:
+            doc = Document.model_validate_json(line)
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=f"Invalid document on line {line_number}: {e}")
+        batch.append({"content": doc.content, "metadata": doc.metadata or {}})
+        total += 1
+        if len(batch) >= settings.rag_index_batch_size:
+            await flush()
+
+    def extend_line(buffer: bytearray, data: bytes, line_number: int):
+        buffer += data
+        if len(buffer) > MAX_STREAM_LINE_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Line {line_number} exceeds {MAX_STREAM_LINE_BYTES} bytes"
+            )
+
+    try:
+        buffer = bytearray()
+        line_number = 0
+        async for chunk in request.stream():
+            # Only the new bytes are scanned for line breaks
+            start = 0
+            newline = chunk.find(b"\n")
+            while newline != -1:
+                line_number += 1
+                extend_line(buffer, chunk[start:newline], line_number)
+                await add_line(bytes(buffer), line_number)
+                buffer.clear()
+                start = newline + 1
+                newline = chunk.find(b"\n", start)
+            extend_line(buffer, chunk[start:], line_number + 1)
+        # The last line may lack a trailing newline
+        await add_line(bytes(buffer), line_number + 1)
+        if batch:
+            await flush()
+        indexed_count = sum(await asyncio.gather(*tasks))
+        return {
+            "status": "success",
+            "indexed_chunks": indexed_count,
+            "total_documents": total
+        }
+    except HTTPException:
+        # Batches already handed to the pipeline still finish
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    except Exception as e:
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise HTTPException(status_code=500, detail=f"Failed to index documents: {e}")
+
+@router.get("/rag/index/status/{job_id}")
+async def index_status(job_id: str):
+    """
+    Progress of a background indexing job started with async_mode.
+    """
+    job = INDEX_JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown index job: {job_id}")
+    return job
+
+async def _run_index(job_id: str, rag_pipeline, documents: List[Dict[str, Any]], request: IndexRequest):
+    """Index in the background, recording progress in INDEX_JOBS after every batch."""
+    job = INDEX_JOBS[job_id]
+    job["status"] = "running"
+
+    def on_batch(documents_done: int, chunks_done: int):
+        job["indexed_documents"] += documents_done
+        job["indexed_chunks"] += chunks_done
+        job["progress"] = job["indexed_documents"] / max(job["total_documents"], 1)
+
+    try:
+        await index_concurrently(
+            rag_pipeline, documents, request.chunk_size, request.chunk_overlap, on_batch=on_batch
+        )
+        job["status"] = "success"
+        job["progress"] = 1.0
+    except Exception as e:
+        print(f"Index job {job_id} failed: {e}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+    job["finished_at"] = time.time()
+
+def _prune_index_jobs():
+    """Forget the oldest finished jobs once MAX_INDEX_JOBS are tracked."""
+    finished = [job_id for job_id, job in INDEX_JOBS.items() if "finished_at" in job]
+    for job_id in finished[:max(len(INDEX_JOBS) - MAX_INDEX_JOBS + 1, 0)]:
+        del INDEX_JOBS[job_id]
+
 @router.post("/rag/search", response_model=List[SearchResult])
-async def search_documents(request: SearchRequest, rag_pipeline = Depends(get_pipeline)):
+async def search_documents(
+    request: SearchRequest,
+    nprobe: Optional[int] = Query(default=None, ge=1, include_in_schema=False),
+    rag_pipeline = Depends(get_pipeline)
+):
     """
     Search documents using the RAG pipeline's retrieve method (includes expansion & reranking).
     """
     try:
-        results = rag_pipeline.retrieve(query=request.query, top_k=request.top_k)
-        return results
+        results = await retrieve(
+            rag_pipeline, request.query, request.top_k, request.filter, nprobe,
+            request.retrieval_candidates, request.alpha
+        )
+        # Project to the SearchResult shape and let orjson serialize it directly,
+        # skipping response-model validation of every result
+        if not request.include_content:
+            return ORJSONResponse(content=[
+                {"id": str(doc["id"]), "score": doc["score"], "rerank_score": doc.get("rerank_score")}
+                for doc in results
+            ])
+        return ORJSONResponse(content=[_search_result(doc) for doc in results])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to search: {e}")
 
@@ -119,19 +417,78 @@ async def rag_query(request: RAGRequest, rag_pipeline = Depends(get_pipeline)):
     Full RAG pipeline query using the RAG pipeline.
     """
     try:
-        result = rag_pipeline.query(
+        # With the result cache on, let query() check it before anything is retrieved
+        sources = None
+        if rag_pipeline.response_cache is None:
+            sources = await retrieve(rag_pipeline, request.query, request.top_k)
+        result = await asyncio.to_thread(
+            rag_pipeline.query,
+            sources=sources,
             query=request.query,
             top_k=request.top_k,
             use_compression=request.use_compression,
             use_fact_checking=request.use_fact_checking,
             temperature=request.temperature,
             max_tokens=request.max_tokens,
+            max_context_tokens=request.max_context_tokens,
             system_prompt=request.system_prompt
         )
-        return result
+        return ORJSONResponse(content={
+            "answer": result["answer"],
+            "sources": [_search_result(doc) for doc in result["sources"]],
+            "model": result["model"],
+            "fact_check": result["fact_check"]
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to process RAG query: {e}")
 
+@router.post("/rag/query/stream")
+async def rag_query_stream(request: RAGRequest, rag_pipeline = Depends(get_pipeline)):
+    """
+    Full RAG pipeline query, streamed as Server-Sent Events.
+
+    Emits the sources first, then one event per generated token, then the
+    model and fact-check result, and finally [DONE].
+    """
+    try:
+        sources = await retrieve(rag_pipeline, request.query, request.top_k)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to process RAG query: {e}")
+
+    return StreamingResponse(
+        _stream_chunks(_project_sources(
+            rag_pipeline.query_stream(
+                sources=sources,
+                query=request.query,
+                top_k=request.top_k,
+                use_compression=request.use_compression,
+                use_fact_checking=request.use_fact_checking,
+                temperature=request.temperature,
+                max_tokens=request.max_tokens,
+                max_context_tokens=request.max_context_tokens,
+                system_prompt=request.system_prompt
+            )
+        )),
+        media_type="text/event-stream"
+    )
+
+async def _project_sources(events):
+    """Project sources to the SearchResult shape, like the non-streaming endpoints."""
+    async for event in events:
+        if "sources" in event:
+            event = {"sources": [_search_result(doc) for doc in event["sources"]]}
+        yield event
+
+def _search_result(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """A pipeline document in the SearchResult shape, with the id as a string."""
+    return {
+        "id": str(doc["id"]),
+        "content": doc["content"],
+        "score": doc["score"],
+        "metadata": doc.get("metadata"),
+        "rerank_score": doc.get("rerank_score")
+    }
+
 @router.delete("/rag/clear")
 async def clear_index(rag_pipeline = Depends(get_pipeline)):
     """Clear the index in the RAG pipeline."""
@@ -158,7 +515,9 @@ async def expand_query(request: ExpandQueryRequest, rag_pipeline = Depends(get_p
     Directly access the Query Expansion module.
     """
     try:
-        expanded = rag_pipeline.query_expander.expand(request.query, request.num_expansions)
+        expanded = await run_in_executor(
+            rag_pipeline.query_expander.expand, request.query, request.num_expansions
+        )
         return {"original": request.query, "expanded": expanded}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to expand query: {e}")
@@ -169,10 +528,7 @@ async def rerank_documents(request: RerankRequest, rag_pipeline = Depends(get_pi
     Directly access the Reranker module.
     """
     try:
-        # Convert Pydantic models to dicts
-        docs_dicts = [doc.model_dump() for doc in request.documents]
-        reranked = rag_pipeline.reranker.rerank(request.query, docs_dicts, request.top_k)
-        return reranked
+        return await run_in_executor(_rerank, rag_pipeline, request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to rerank documents: {e}")
 
@@ -182,13 +538,7 @@ async def compress_context(request: CompressRequest, rag_pipeline = Depends(get_
     Directly access the Context Compression module.
     """
     try:
-        docs_dicts = [doc.model_dump() for doc in request.documents]
-        compressed = rag_pipeline.context_compressor.compress(
-            request.query,
-            docs_dicts,
-            request.max_sentences_per_doc
-        )
-        return compressed
+        return await run_in_executor(_compress, rag_pipeline, request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to compress context: {e}")
 
@@ -198,8 +548,29 @@ async def fact_check(request: FactCheckRequest, rag_pipeline = Depends(get_pipel
     Directly access the Fact Checker module.
     """
     try:
-        docs_dicts = [doc.model_dump() for doc in request.documents]
-        result = rag_pipeline.fact_checker.check(request.answer, docs_dicts)
-        return result
+        return await run_in_executor(_fact_check, rag_pipeline, request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fact check: {e}")
+
+# --- Blocking bodies of the module endpoints, run on the RAG thread pool ---
+# Converting the Pydantic documents to dicts happens here too, off the event loop.
+
+def _docs_to_dicts(documents: List[Document]) -> List[Dict[str, Any]]:
+    # Plain attribute reads; model_dump() walks the schema for every document
+    return [{"id": doc.id, "content": doc.content, "metadata": doc.metadata or {}} for doc in documents]
+
+def _rerank(rag_pipeline, request: RerankRequest):
+    docs_dicts = _docs_to_dicts(request.documents)
+    return rag_pipeline.reranker.rerank(request.query, docs_dicts, request.top_k)
+
+def _compress(rag_pipeline, request: CompressRequest):
+    docs_dicts = _docs_to_dicts(request.documents)
+    return rag_pipeline.context_compressor.compress(
+        request.query,
+        docs_dicts,
+        request.max_sentences_per_doc
+    )
+
+def _fact_check(rag_pipeline, request: FactCheckRequest):
+    docs_dicts = _docs_to_dicts(request.documents)
+    return rag_pipeline.fact_checker.check(request.answer, docs_dicts)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the worker packages (rag, models, routers) from the worker root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,36 @@
+"""
+VectorStore persistence tests
+"""
+
+import numpy as np
+
+from rag.vector_store import VectorStore
+
+
+def _random_rows(count: int, dimension: int, seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((count, dimension)).astype(np.float32)
+
+
+def test_save_load_add_round_trip_beyond_initial_capacity(tmp_path):
+    dimension = 8
+    rows = 1500  # more than the default initial_capacity of 1024
+    path = str(tmp_path / "store")
+
+    store = VectorStore(dimension=dimension, index_type="flat")
+    store.add_batch(_random_rows(rows, dimension, seed=0), [{"content": f"doc {i}"} for i in range(rows)])
+    store.save(path)
+
+    loaded = VectorStore(dimension=dimension, index_type="flat")
+    loaded.load(path)
+    assert loaded.count() == rows
+
+    # The first add after loading grows the memory-mapped matrix and every per-row array
+    extra = _random_rows(10, dimension, seed=1)
+    ids = loaded.add_batch(extra, [{"content": f"new {i}"} for i in range(10)])
+    assert ids == list(range(rows, rows + 10))
+    assert loaded.count() == rows + 10
+
+    doc_id, score, document = loaded.search(extra[3], top_k=1)[0]
+    assert doc_id == rows + 3
+    assert document["content"] == "new 3"
+    assert score > 0.99